@@ -1,12 +1,17 @@
 """Module to handle book routes"""
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.models import Book, Review
-from app.schemas import BookCreate, BookResponse, BookUpdate
-from app.database import get_db
+from app.schemas import BookCreate, BookResponse, BookUpdate, SimilarBookResponse
+from app.database import get_db, async_session
+from app.serialization import BOOK_COLUMNS, book_row_adapter, book_rows_adapter, ndjson_response, rows_response, wants_ndjson
 from app.auth import get_current_user
+from app.config import settings
+from app.events import event_bus, BOOK, CREATED, UPDATED, DELETED
+from app.services import similar_books
+from app.services.similar_books import similar_books_index
 
 router = APIRouter()
 
@@ -18,14 +23,17 @@ async def create_book(book: BookCreate, db: AsyncSession = Depends(get_db), user
     db.add(db_book)
     await db.commit()
     await db.refresh(db_book)
+    await event_bus.publish(BOOK, CREATED, db_book.id)
     return db_book
 
 @router.get("/", response_model=List[BookResponse])
-async def get_books(db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user)):
-    """Get all books"""
-    result = await db.execute(select(Book))
-    books = result.scalars().all()
-    return books
+async def get_books(request: Request, db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user)):
+    """Get all books as JSON, or as an NDJSON stream when requested"""
+    statement = select(*BOOK_COLUMNS).order_by(Book.id)
+    if wants_ndjson(request):
+        return ndjson_response(async_session, statement, book_row_adapter)
+    result = await db.execute(statement)
+    return rows_response(result.mappings().all(), book_rows_adapter)
 
 
 @router.get("/{book_id}", response_model=BookResponse)
@@ -51,6 +59,7 @@ async def update_book(book_id: int, book: BookUpdate, db: AsyncSession = Depends
     
     await db.commit()
     await db.refresh(db_book)
+    await event_bus.publish(BOOK, UPDATED, db_book.id)
     return db_book
 
 @router.delete("/{book_id}", response_model=BookResponse)
@@ -64,6 +73,7 @@ async def delete_book(book_id: int, db: AsyncSession = Depends(get_db), user_id:
     
     await db.delete(db_book)
     await db.commit()
+    await event_bus.publish(BOOK, DELETED, book_id)
     return db_book
 
 @router.get("/{book_id}/summary")
@@ -93,3 +103,24 @@ async def get_book_summary(book_id: int, db: AsyncSession = Depends(get_db), use
         "summary": db_book.summary,  # Fetch the summary from the book column
         "average_rating": avg_rating
     }
+
+@router.get("/{book_id}/similar", response_model=List[SimilarBookResponse])
+async def get_similar_books(book_id: int, db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user)):
+    """Get the precomputed most similar books"""
+    neighbours = None
+    if settings.SIMILAR_BOOKS_ENABLED:
+        similar_books.follow_current_version()
+        neighbours = similar_books_index.similar(book_id)
+    if neighbours is None:
+        raise HTTPException(status_code=404, detail="Similar books not available")
+    if not neighbours:
+        return []
+
+    scores = dict(neighbours)
+    result = await db.execute(select(Book.id, Book.title, Book.author).filter(Book.id.in_(scores)))
+    details = {row.id: row for row in result.all()}
+    return [
+        {"id": neighbour_id, "title": details[neighbour_id].title, "author": details[neighbour_id].author, "score": score}
+        for neighbour_id, score in neighbours
+        if neighbour_id in details
+    ]
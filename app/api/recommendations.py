@@ -1,9 +1,13 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException
-from app.services.recommendation_engine import recommend_books
+from app.services.recommendation_engine import recommend_books, search_catalog
+from app.services import sharded_search
 from app.auth import get_current_user
 from app.schemas import RecommendationRequest, RecommendationResponse
-from app.database import get_db
+from app.database import async_session
 from app.models import Book
+from app.services.single_flight import request_key, single_flight
+from app.profiling import profile_in_thread
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
@@ -16,12 +20,23 @@ async def get_all_books(db: AsyncSession):
     books = result.scalars().all()
     return books
 
+async def compute_recommendation(content):
+    """One recommendation run, shared by every identical query in flight"""
+    if sharded_search.catalog_enabled():
+        # The catalog search holds every book's vector; only the hits' titles are read from the database
+        return await search_catalog(content)
+    # Its own session: the run can outlive the request that started it
+    async with async_session() as session:
+        books = await get_all_books(session)
+    return await asyncio.to_thread(profile_in_thread(recommend_books), content, books)
+
 @router.get("/", response_model=RecommendationResponse)
-async def generate_recommendations(request: RecommendationRequest, db: AsyncSession = Depends(get_db), current_user: str = Depends(get_current_user)):
+async def generate_recommendations(request: RecommendationRequest, current_user: str = Depends(get_current_user)):
     """Calling llama_service"""
     try:
-        books = await get_all_books(db)
-        recommendation = recommend_books(request.content, books)
+        # Identical queries in flight share one catalog read, embedding and scoring run
+        key = request_key("recommendation", {"content": request.content})
+        recommendation = await single_flight.do(key, lambda: compute_recommendation(request.content))
         return {"recommendation": recommendation}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching recommendations: {e}") from e
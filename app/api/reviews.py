@@ -1,12 +1,16 @@
 """Module to define reviews routes"""
 from typing import List
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.models import Review, Book
 from app.schemas import ReviewCreate, ReviewResponse
-from app.database import get_db
+from app.database import get_db, async_session
+from app.serialization import REVIEW_COLUMNS, review_row_adapter, review_rows_adapter, ndjson_response, rows_response, wants_ndjson
 from app.auth import get_current_user
+from app.config import settings
+from app.events import event_bus, REVIEW, CREATED
+from app.services.review_writer import BookNotFound, review_writer
 
 
 router = APIRouter()
@@ -15,6 +19,13 @@ router = APIRouter()
 @router.post("/{book_id}", response_model=ReviewResponse)
 async def create_review(book_id: int, review: ReviewCreate, db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user)):
     """Add a review for a book"""
+    if settings.REVIEW_WRITE_BEHIND:
+        # Group commit: validated here, inserted with other reviews in one batch
+        try:
+            return await review_writer.submit(book_id, user_id, review.dict())
+        except BookNotFound:
+            raise HTTPException(status_code=404, detail="Book not found")
+
     db_book = await db.execute(select(Book).filter(Book.id == book_id))
     db_book = db_book.scalars().first()
     
@@ -25,17 +36,20 @@ async def create_review(book_id: int, review: ReviewCreate, db: AsyncSession = D
     db.add(db_review)
     await db.commit()
     await db.refresh(db_review)
+    await event_bus.publish(REVIEW, CREATED, db_review.id, book_id=book_id)
     return db_review
 
 @router.get("/{book_id}", response_model=List[ReviewResponse])
-async def get_reviews(book_id: int, db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user)):
-    """Get a review for a book"""
-    db_book = await db.execute(select(Book).filter(Book.id == book_id))
+async def get_reviews(book_id: int, request: Request, db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user)):
+    """Get the reviews for a book as JSON, or as an NDJSON stream when requested"""
+    db_book = await db.execute(select(Book.id).filter(Book.id == book_id))
     db_book = db_book.scalars().first()
 
     if not db_book:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    result = await db.execute(select(Review).filter(Review.book_id == book_id))
-    reviews = result.scalars().all()
-    return reviews
+    statement = select(*REVIEW_COLUMNS).filter(Review.book_id == book_id).order_by(Review.id)
+    if wants_ndjson(request):
+        return ndjson_response(async_session, statement, review_row_adapter)
+    result = await db.execute(statement)
+    return rows_response(result.mappings().all(), review_rows_adapter)
@@ -1,8 +1,9 @@
 """Summary endpoint definiton"""
 from fastapi import APIRouter, Depends, HTTPException
-from app.services.llama_service import llama_service
+from app.services.llama_service import llama_service, MAP, REDUCE
 from app.auth import get_current_user
 from app.schemas import SummaryRequest, SummaryResponse
+from app.services.single_flight import request_key, single_flight
 
 router = APIRouter()
 
@@ -10,7 +11,13 @@ router = APIRouter()
 async def generate_summary(request: SummaryRequest, current_user: str = Depends(get_current_user)):
     """Calling llama_service"""
     try:
-        summary = await llama_service.generate_summary(request.content)
+        # Identical requests in flight share one summarization run
+        key = request_key("summary", {
+            "content": request.content,
+            "models": [llama_service.stage_model(MAP), llama_service.stage_model(REDUCE)],
+            "options": [llama_service.stage_options(MAP), llama_service.stage_options(REDUCE)],
+        })
+        summary = await single_flight.do(key, lambda: llama_service.generate_summary(request.content))
         return {"summary": summary}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating summary: {e}") from e
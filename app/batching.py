@@ -0,0 +1,30 @@
+"""Module to collect queued items into batches"""
+import asyncio
+
+_UNSET = object()
+
+
+async def next_batch(queue, max_batch, max_delay, first_timeout=None, stop_after=_UNSET):
+    """
+    Wait for one item, then keep collecting until the batch holds `max_batch`
+    items or `max_delay` seconds have passed since the first one, whichever
+    comes first. Collection also ends right after the `stop_after` item.
+
+    With `first_timeout`, waiting for the first item raises asyncio.TimeoutError
+    after that many seconds.
+    """
+    loop = asyncio.get_running_loop()
+    if first_timeout is None:
+        batch = [await queue.get()]
+    else:
+        batch = [await asyncio.wait_for(queue.get(), first_timeout)]
+    deadline = loop.time() + max_delay
+    while len(batch) < max_batch and batch[-1] is not stop_after:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
@@ -14,8 +14,37 @@ class Settings(BaseSettings):
     ALGORITHM: str = os.getenv('ALGORITHM')
     ACCESS_TOKEN_EXPIRE_MINUTES: int = os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES')
     OLLAMA_MODEL: str = os.getenv('OLLAMA_MODEL')
+    OLLAMA_HOST: str = os.getenv('OLLAMA_HOST', '')
+    OLLAMA_MAP_MODEL: str = os.getenv('OLLAMA_MAP_MODEL', '')
+    OLLAMA_REDUCE_MODEL: str = os.getenv('OLLAMA_REDUCE_MODEL', '')
+    OLLAMA_MAP_OPTIONS: str = os.getenv('OLLAMA_MAP_OPTIONS', '')
+    OLLAMA_REDUCE_OPTIONS: str = os.getenv('OLLAMA_REDUCE_OPTIONS', '')
+    OLLAMA_KEEP_ALIVE: str = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+    OLLAMA_MAX_CONNECTIONS: int = os.getenv('OLLAMA_MAX_CONNECTIONS', 32)
+    OLLAMA_POOL_TIMEOUT: float = os.getenv('OLLAMA_POOL_TIMEOUT', 120)
     CHUNK_SIZE: int = os.getenv('CHUNK_SIZE')
     MAX_WORKERS: int = os.getenv('MAX_WORKERS')
     EMBEDDING_MODEL: str = os.getenv('EMBEDDING_MODEL')
+    EMBEDDING_BACKEND: str = os.getenv('EMBEDDING_BACKEND', 'local')
+    EMBEDDING_MAX_SEQ_LENGTH: int = os.getenv('EMBEDDING_MAX_SEQ_LENGTH', 0)
+    EMBEDDING_LENGTH_BUCKETS: str = os.getenv('EMBEDDING_LENGTH_BUCKETS', '')
+    EMBEDDING_BATCH_TOKENS: int = os.getenv('EMBEDDING_BATCH_TOKENS', 8192)
+    EMBEDDING_SOCKET: str = os.getenv('EMBEDDING_SOCKET', '/tmp/book-embeddings.sock')
+    TORCH_NUM_THREADS: int = os.getenv('TORCH_NUM_THREADS', 0)
+    EMBEDDING_SERVER_THREADS: int = os.getenv('EMBEDDING_SERVER_THREADS', 0)
+    EMBEDDING_INDEX_DIR: str = os.getenv('EMBEDDING_INDEX_DIR', 'embedding_index')
+    REVIEW_WRITE_BEHIND: bool = os.getenv('REVIEW_WRITE_BEHIND', False)
+    REVIEW_BATCH_SIZE: int = os.getenv('REVIEW_BATCH_SIZE', 500)
+    REVIEW_BATCH_INTERVAL_MS: int = os.getenv('REVIEW_BATCH_INTERVAL_MS', 20)
+    SEARCH_WORKERS: int = os.getenv('SEARCH_WORKERS', 0)
+    SIMILAR_BOOKS_ENABLED: bool = os.getenv('SIMILAR_BOOKS_ENABLED', False)
+    SIMILAR_BOOKS_K: int = os.getenv('SIMILAR_BOOKS_K', 10)
+    EVENT_BUS_NOTIFY: bool = os.getenv('EVENT_BUS_NOTIFY', False)
+    EVENT_BUS_CHANNEL: str = os.getenv('EVENT_BUS_CHANNEL', 'book_changes')
+    EVENT_BUS_REORDER_MS: int = os.getenv('EVENT_BUS_REORDER_MS', 2000)
+    PROFILING_ENABLED: bool = os.getenv('PROFILING_ENABLED', False)
+    PROFILING_TOKEN: str = os.getenv('PROFILING_TOKEN', '')
+    PROFILE_DIR: str = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_SAMPLE_RATES: str = os.getenv('PROFILE_SAMPLE_RATES', '')
 
 settings = Settings()
@@ -3,8 +3,10 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 from app.models import Base
+from app.db_instrumentation import instrument_engine
 
 engine = create_async_engine(settings.DATABASE_URL, echo=True)
+instrument_engine(engine)
 async_session = sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -0,0 +1,210 @@
+"""Module to count SQL statements and DB time per request"""
+import json
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+from sqlalchemy import event, text
+from app import metrics
+
+# Routes and the maximum number of statements each one may issue.
+# Keyed by "<METHOD> <route path template>"; test responses are matched to a template by their URL.
+ROUTE_QUERY_BUDGETS = {
+    "POST /books/": 2,
+    "GET /books/": 1,
+    "GET /books/{book_id}": 1,
+    "PUT /books/{book_id}": 3,
+    "DELETE /books/{book_id}": 4,
+    "GET /books/{book_id}/summary": 2,
+    "GET /books/{book_id}/similar": 1,
+    "POST /reviews/{book_id}": 3,
+    "GET /reviews/{book_id}": 2,
+    "GET /recommendations/": 1,
+    "POST /auth/sign-up": 4,
+    "POST /auth/login": 1,
+}
+
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+QUERY_TIME_HEADER = "X-DB-Time-Ms"
+
+
+@dataclass
+class QueryStats:
+    """Statements and DB time collected for one request (or one test block)"""
+    count: int = 0
+    duration: float = 0.0
+    statements: List[str] = field(default_factory=list)
+    parameters: List[Any] = field(default_factory=list)
+    capture: bool = False
+    # Stats of an enclosing block, e.g. a test tracking every request it makes
+    parent: Optional["QueryStats"] = None
+
+    def record(self, statement, parameters, duration):
+        self.count += 1
+        self.duration += duration
+        if self.capture:
+            self.statements.append(statement)
+            self.parameters.append(parameters)
+        if self.parent is not None:
+            self.parent.record(statement, parameters, duration)
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the per-statement context, so a failed statement leaves nothing behind on the connection
+    context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context._query_start_time
+    metrics.stage_duration.observe(duration, metrics.DB_EXECUTE)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, parameters, duration)
+
+
+def instrument_engine(engine):
+    """Attach the statement counters to an engine (sync or async)"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+@contextmanager
+def track_queries(capture=False):
+    """Collect statements executed in the current context"""
+    stats = QueryStats(capture=capture)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+@contextmanager
+def query_budget(max_statements):
+    """Fail if the block executes more than `max_statements` statements"""
+    with track_queries(capture=True) as stats:
+        yield stats
+    if stats.count > max_statements:
+        executed = "\n".join(stats.statements)
+        raise AssertionError(
+            f"Expected at most {max_statements} statements, got {stats.count}:\n{executed}"
+        )
+
+
+def _route_pattern(template):
+    return re.compile("^" + re.sub(r"\\{[^/]+?\\}", "[^/]+", re.escape(template)) + "$")
+
+
+_ROUTE_PATTERNS = {key: _route_pattern(key.split(" ", 1)[1]) for key in ROUTE_QUERY_BUDGETS}
+
+
+def route_key_for(method, path):
+    """The ROUTE_QUERY_BUDGETS key whose path template matches a concrete request path"""
+    for key, pattern in _ROUTE_PATTERNS.items():
+        if key.startswith(f"{method} ") and pattern.match(path):
+            return key
+    raise KeyError(f"No query budget for {method} {path}")
+
+
+def assert_route_budget(response, route_key=None):
+    """Check a test response's query-count header against ROUTE_QUERY_BUDGETS"""
+    if route_key is None:
+        route_key = route_key_for(response.request.method, response.request.url.path)
+    count = int(response.headers[QUERY_COUNT_HEADER])
+    budget = ROUTE_QUERY_BUDGETS[route_key]
+    assert count <= budget, f"{route_key} issued {count} statements, budget is {budget}"
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware adding per-request statement count and DB time headers"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent = _current_stats.get()
+        stats = QueryStats(capture=parent is not None and parent.capture, parent=parent)
+        token = _current_stats.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((QUERY_COUNT_HEADER.lower().encode(), str(stats.count).encode()))
+                headers.append((QUERY_TIME_HEADER.lower().encode(), f"{stats.duration * 1000:.3f}".encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current_stats.reset(token)
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            metrics.db_statements.inc(stats.count, scope["method"], route_path)
+            metrics.db_time.inc(stats.duration, scope["method"], route_path)
+
+
+def _seq_scans(plan):
+    """Yield (relation, filter) for every filtered Seq Scan node in an EXPLAIN plan"""
+    if plan.get("Node Type") == "Seq Scan" and "Filter" in plan:
+        yield plan["Relation Name"], plan["Filter"]
+    for child in plan.get("Plans", []):
+        yield from _seq_scans(child)
+
+
+def _sqlite_scans(conn, statement, parameters):
+    """SQLite reports a full table scan as "SCAN <table>"; only filtered statements are flagged"""
+    where = re.search(r"\bWHERE\b", statement, re.IGNORECASE)
+    if where is None:
+        return
+    for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all():
+        match = re.match(r"SCAN (\w+)$", row[-1])
+        if match:
+            yield match.group(1), statement[where.end():].strip()
+
+
+def _postgresql_scans(conn, statement, parameters):
+    plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    yield from _seq_scans(plan[0]["Plan"])
+
+
+def _estimated_rows(conn, relation):
+    if conn.dialect.name == "postgresql":
+        rows = conn.execute(text("SELECT reltuples FROM pg_class WHERE relname = :name"), {"name": relation})
+    else:
+        rows = conn.execute(text(f'SELECT count(*) FROM "{relation}"'))
+    return rows.scalar() or 0
+
+
+def find_sequential_scans(conn, stats, min_rows=10000):
+    """
+    Run EXPLAIN on the statements captured by `track_queries(capture=True)`
+    and report filtered sequential scans on tables estimated to hold at least
+    `min_rows` rows. Takes a sync connection; from async code use
+    `await conn.run_sync(find_sequential_scans, stats)`.
+    """
+    explain = _postgresql_scans if conn.dialect.name == "postgresql" else _sqlite_scans
+    findings, seen = [], set()
+    for statement, parameters in zip(stats.statements, stats.parameters):
+        if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")) or statement in seen:
+            continue
+        seen.add(statement)
+        for relation, condition in explain(conn, statement, parameters):
+            estimated = _estimated_rows(conn, relation)
+            if estimated >= min_rows:
+                findings.append({"statement": statement, "table": relation, "filter": condition, "rows": int(estimated)})
+    return findings
@@ -0,0 +1,305 @@
+"""
+Module to publish book and review change events to in-process subscribers.
+
+Routes publish after their transaction commits. Each subscriber has its own
+queue and task, so it receives events asynchronously and in batches. Every
+event carries a sequence number. Events that arrive out of order are held
+back until the missing ones arrive. A subscriber whose gap is still open
+after a short reorder window knows it missed events and rebuilds its state
+from scratch instead of applying them.
+
+With EVENT_BUS_NOTIFY enabled, events are also fanned out to every other
+worker and node through PostgreSQL LISTEN/NOTIFY. Sequence numbers then come
+from a shared database sequence.
+"""
+import asyncio
+import json
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Optional
+from app.batching import next_batch
+from app.config import settings
+
+BOOK = "book"
+REVIEW = "review"
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+SEQUENCE_NAME = "change_event_seq"
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+_NOTIFY_BATCH = 50
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    seq: int
+    entity: str
+    op: str
+    id: int
+    book_id: Optional[int] = None
+    origin: str = ""
+
+
+class Subscriber:
+    """Queue plus drain task delivering batches of events to one handler"""
+
+    def __init__(
+        self, name, handler, rebuild=None, entities=None, max_batch=256, max_delay_ms=50, retry_delay=5.0,
+        reorder_ms=None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.rebuild = rebuild
+        self.entities = set(entities) if entities else None
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.retry_delay = retry_delay
+        # Local events are dispatched at once and remote ones via NOTIFY, so arrival order can lag the sequence
+        self.reorder_timeout = int(settings.EVENT_BUS_REORDER_MS if reorder_ms is None else reorder_ms) / 1000
+        self.last_seq = None
+        # Events ahead of a missing sequence number, by seq, and when we started waiting for it
+        self.pending = {}
+        self.gap_since = None
+        # Set when our state may have diverged: a sequence gap, a failed handler or a lost event
+        self.dirty = False
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def wants(self, event):
+        return self.entities is None or event.entity in self.entities
+
+    def mark_missed(self):
+        """Events were lost before reaching this subscriber; rebuild as soon as possible"""
+        if self.rebuild is not None:
+            self.dirty = True
+            self.queue.put_nowait(None)
+
+    def _first_timeout(self):
+        if self.dirty:
+            # Retry a failed rebuild even if no further events arrive
+            return self.retry_delay
+        if self.pending:
+            # Wake up when the reorder window closes
+            return max(0.0, self.gap_since + self.reorder_timeout - asyncio.get_running_loop().time())
+        return None
+
+    async def run(self):
+        while True:
+            try:
+                batch = await next_batch(self.queue, self.max_batch, self.max_delay, first_timeout=self._first_timeout())
+            except asyncio.TimeoutError:
+                batch = [None]
+            await self.deliver(batch)
+
+    def _in_order(self):
+        """
+        Pop the pending events that continue the sequence. A gap still open
+        after the reorder window is declared missed, and the events behind it
+        are released too.
+        """
+        if not self.pending:
+            return []
+        if self.last_seq is None:
+            self.last_seq = min(self.pending) - 1
+        events = []
+        while self.last_seq + 1 in self.pending:
+            self.last_seq += 1
+            events.append(self.pending.pop(self.last_seq))
+        if not self.pending:
+            self.gap_since = None
+            return events
+
+        now = asyncio.get_running_loop().time()
+        if self.gap_since is None or events:
+            self.gap_since = now
+        if now - self.gap_since >= self.reorder_timeout:
+            if self.rebuild is not None:
+                print(f"Subscriber {self.name} missed events before seq {min(self.pending)}")
+                self.dirty = True
+            events.extend(self.pending.pop(seq) for seq in sorted(self.pending))
+            self.last_seq = events[-1].seq
+            self.gap_since = None
+        return events
+
+    async def deliver(self, batch):
+        for event in batch:
+            # Late or duplicate events are already reflected in our state; None only wakes us up
+            if event is not None and (self.last_seq is None or event.seq > self.last_seq):
+                self.pending[event.seq] = event
+        events = self._in_order()
+
+        if self.dirty:
+            # A rebuild reads current state, which already includes every event seen so far
+            if self.pending:
+                self.last_seq = max(self.pending)
+                self.pending.clear()
+                self.gap_since = None
+            try:
+                print(f"Subscriber {self.name} rebuilding")
+                await self.rebuild()
+                self.dirty = False
+            except Exception as e:
+                print(f"Subscriber {self.name} rebuild failed: {e}")
+            return
+
+        relevant = [event for event in events if self.wants(event)]
+        if not relevant:
+            return
+        try:
+            await self.handler(relevant)
+        except Exception as e:
+            print(f"Subscriber {self.name} failed: {e}")
+            if self.rebuild is not None:
+                self.dirty = True
+
+
+class EventBus:
+    """In-process publish/subscribe for change events, optionally fanned out via LISTEN/NOTIFY"""
+
+    def __init__(self, notify=None, channel=None, reconnect_delay=1.0):
+        self.notify = settings.EVENT_BUS_NOTIFY if notify is None else notify
+        self.channel = channel or settings.EVENT_BUS_CHANNEL
+        self.reconnect_delay = reconnect_delay
+        self.node_id = uuid.uuid4().hex
+        self._subscribers = []
+        self._seq = 0
+        self._connection = None
+        self._connection_lock = asyncio.Lock()
+        self._reconnect_task = None
+        self._started = False
+
+    def subscribe(self, name, handler, rebuild=None, entities=None, max_batch=256, max_delay_ms=50, reorder_ms=None):
+        """Register `async handler(events)`; `async rebuild()` is called instead when events were missed"""
+        subscriber = Subscriber(name, handler, rebuild, entities, max_batch, max_delay_ms, reorder_ms=reorder_ms)
+        self._subscribers.append(subscriber)
+        if self._started:
+            subscriber.task = asyncio.create_task(subscriber.run())
+        return subscriber
+
+    async def _connect(self):
+        import asyncpg
+        dsn = settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+        connection = await asyncpg.connect(dsn)
+        await connection.execute(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE_NAME}")
+        await connection.add_listener(self.channel, self._on_notify)
+        connection.add_termination_listener(self._on_terminated)
+        return connection
+
+    async def start(self):
+        self._started = True
+        for subscriber in self._subscribers:
+            if subscriber.task is None:
+                subscriber.task = asyncio.create_task(subscriber.run())
+        if self.notify and self._connection is None:
+            self._connection = await self._connect()
+
+    async def stop(self):
+        self._started = False
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        for subscriber in self._subscribers:
+            if subscriber.task is not None:
+                subscriber.task.cancel()
+                subscriber.task = None
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await connection.close()
+
+    def _mark_missed(self):
+        for subscriber in self._subscribers:
+            subscriber.mark_missed()
+
+    def _on_terminated(self, connection):
+        if connection is self._connection:
+            self._connection_lost(ConnectionError("LISTEN connection terminated"))
+
+    def _connection_lost(self, error):
+        """Drop the broken connection and reconnect in the background"""
+        print(f"Event bus connection lost: {error}")
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.terminate()
+        if self._started and (self._reconnect_task is None or self._reconnect_task.done()):
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = self.reconnect_delay
+        while self._started:
+            try:
+                connection = await self._connect()
+                # Burn a sequence number so every node sees a gap and rebuilds
+                await connection.fetchval(f"SELECT nextval('{SEQUENCE_NAME}')")
+            except Exception as e:
+                print(f"Event bus reconnect failed: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            self._connection = connection
+            # Notifications from other nodes were lost while we were disconnected
+            self._mark_missed()
+            return
+
+    async def _next_seqs(self, count):
+        if not self.notify:
+            start = self._seq + 1
+            self._seq += count
+            return list(range(start, start + count))
+        if self._connection is None:
+            raise ConnectionError("Event bus is reconnecting")
+        async with self._connection_lock:
+            rows = await self._connection.fetch(
+                f"SELECT nextval('{SEQUENCE_NAME}') AS seq FROM generate_series(1, $1)", count
+            )
+        return [row["seq"] for row in rows]
+
+    def _dispatch(self, events):
+        if not self._started:
+            return
+        for subscriber in self._subscribers:
+            for event in events:
+                subscriber.queue.put_nowait(event)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        events = [ChangeEvent(**item) for item in json.loads(payload)]
+        self._dispatch([event for event in events if event.origin != self.node_id])
+
+    async def publish_many(self, entity, op, items):
+        """
+        Publish one event per (id, book_id) item; call only after the change is
+        committed. Never raises: events that cannot be published are counted as
+        missed, so subscribers rebuild instead.
+        """
+        if not items:
+            return []
+        try:
+            seqs = await self._next_seqs(len(items))
+        except Exception as e:
+            if self._connection is not None:
+                self._connection_lost(e)
+            self._mark_missed()
+            return []
+        events = [
+            ChangeEvent(seq=seq, entity=entity, op=op, id=item_id, book_id=book_id, origin=self.node_id)
+            for seq, (item_id, book_id) in zip(seqs, items)
+        ]
+        self._dispatch(events)
+        if self._connection is not None:
+            try:
+                async with self._connection_lock:
+                    for start in range(0, len(events), _NOTIFY_BATCH):
+                        payload = json.dumps([asdict(event) for event in events[start:start + _NOTIFY_BATCH]])
+                        await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+            except Exception as e:
+                # The sequence numbers are used, so other nodes see the gap and rebuild
+                self._connection_lost(e)
+        return events
+
+    async def publish(self, entity, op, item_id, book_id=None):
+        """Publish a single change event after commit; returns None if it could not be published"""
+        events = await self.publish_many(entity, op, [(item_id, book_id)])
+        return events[0] if events else None
+
+
+event_bus = EventBus()
@@ -1,10 +1,21 @@
 # app/main.py
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from app.api import books, reviews, recommendations, summaries, auth
 from app.database import engine
 from app.models import Base
+from app.config import settings
+from app.services.review_writer import review_writer
+from app.services.llama_service import llama_service
+from app.services import similar_books, sharded_search
+from app.events import event_bus, BOOK
+from app.db_instrumentation import QueryStatsMiddleware
+from app.profiling import ProfilingMiddleware
+from app import metrics
 
 app = FastAPI()
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(metrics.RequestLatencyMiddleware)
 
 # Include Routers
 app.include_router(books.router, prefix="/books", tags=["Books"])
@@ -13,8 +24,33 @@ app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(recommendations.router, prefix="/recommendations", tags=["Recommendations"])
 app.include_router(summaries.router, prefix="/summaries", tags=["Summaries"])
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Expose metrics in the Prometheus text format"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Create the database tables
 @app.on_event("startup")
 async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    if settings.REVIEW_WRITE_BEHIND:
+        await review_writer.start()
+    if settings.SIMILAR_BOOKS_ENABLED:
+        await similar_books.start_similar_books()
+        event_bus.subscribe(
+            "similar_books", similar_books.apply_book_events, rebuild=similar_books.rebuild_from_db, entities={BOOK}
+        )
+    if int(settings.SEARCH_WORKERS):
+        await sharded_search.start_catalog_search()
+        event_bus.subscribe(
+            "catalog_search", sharded_search.apply_book_events, rebuild=sharded_search.rebuild_from_db, entities={BOOK}
+        )
+    await event_bus.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await review_writer.stop()
+    await event_bus.stop()
+    sharded_search.close_catalog_search()
+    llama_service.close()
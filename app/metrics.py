@@ -0,0 +1,191 @@
+"""Module to record Prometheus-style metrics and render them for /metrics"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds. LLM calls routinely take tens of seconds, so the
+# default Prometheus buckets are extended at the top end.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative histogram keyed by label values"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        """Record one observation for the given label values"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        """Observe the wall time spent in the block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, [("le", repr(float(bound)))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            inf = _format_labels(self.labelnames, labels, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{inf} {count}")
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {total}")
+            lines.append(f"{self.name}_count{plain} {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labelvalues):
+        """Increase the counter for the given label values"""
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return "\n".join(lines)
+
+
+# Metric names are part of the alerting contract; do not rename them.
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template, method and status code.",
+    ("method", "route", "status"),
+)
+stage_duration = Histogram(
+    "app_stage_duration_seconds",
+    "Latency of internal processing stages.",
+    ("stage",),
+)
+db_statements = Counter(
+    "db_statements_total",
+    "SQL statements executed, by route.",
+    ("method", "route"),
+)
+db_time = Counter(
+    "db_time_seconds_total",
+    "Time spent executing SQL statements, by route.",
+    ("method", "route"),
+)
+
+llm_stage_duration = Histogram(
+    "llm_stage_duration_seconds",
+    "Wall time of each summarization stage (map fan-out or final reduce), by stage and model.",
+    ("stage", "model"),
+)
+llm_calls = Counter(
+    "llm_calls_total",
+    "LLM calls by summarization stage and model.",
+    ("stage", "model"),
+)
+
+# Stage label values
+DB_EXECUTE = "db_execute"
+EMBEDDING_ENCODE = "embedding_encode"
+SIMILARITY_SCORING = "similarity_scoring"
+LLM_SUMMARIZE_CHUNK = "llm_summarize_chunk"
+LLM_CONNECTION_WAIT = "llm_connection_wait"
+EXECUTOR_QUEUE_WAIT = "executor_queue_wait"
+
+REGISTRY = [http_request_duration, stage_duration, db_statements, db_time, llm_stage_duration, llm_calls]
+
+
+def stage_timer(stage):
+    """Time an internal stage under app_stage_duration_seconds"""
+    return stage_duration.time(stage)
+
+
+class RequestLatencyMiddleware:
+    """
+    ASGI middleware recording request latency by route template and status.
+    The clock stops at the final body message, so streamed responses are
+    measured until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        observed = False
+
+        def observe():
+            nonlocal observed
+            observed = True
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            http_request_duration.observe(time.perf_counter() - start, scope["method"], route_path, str(status))
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not observed:
+                observe()
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            if not observed:
+                observe()
+
+
+def render():
+    """Render every registered metric in the Prometheus text format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
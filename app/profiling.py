@@ -0,0 +1,142 @@
+"""Module to profile individual requests on demand"""
+import asyncio
+import cProfile
+import functools
+import hmac
+import os
+import pstats
+import random
+import threading
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+from urllib.parse import parse_qs
+from app.config import settings
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+class ProfileSession:
+    """One profiled request: the event loop profile plus any executor thread profiles"""
+
+    def __init__(self, profile_dir):
+        self.id = uuid.uuid4().hex
+        self.path = os.path.join(profile_dir, f"{self.id}.pstats")
+        self.profiler = cProfile.Profile()
+        self._thread_profilers = []
+        self._lock = threading.Lock()
+
+    def add_thread_profiler(self, profiler):
+        with self._lock:
+            self._thread_profilers.append(profiler)
+
+    def dump(self):
+        """Merge every collected profile and write it as a pstats file"""
+        stats = pstats.Stats(self.profiler)
+        with self._lock:
+            for profiler in self._thread_profilers:
+                stats.add(profiler)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        stats.dump_stats(self.path)
+
+
+_current_session: ContextVar[Optional[ProfileSession]] = ContextVar("profile_session", default=None)
+# cProfile hooks the whole event loop thread, so only one request is profiled at a time
+_session_lock = threading.Lock()
+
+
+def current_session() -> Optional[ProfileSession]:
+    return _current_session.get()
+
+
+def profile_in_thread(fn):
+    """
+    Wrap `fn` so that, if the calling request is being profiled, its run in an
+    executor thread is profiled too and merged into the request's profile.
+    """
+    session = current_session()
+    if session is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profiler = cProfile.Profile()
+        session.add_thread_profiler(profiler)
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+
+    return wrapper
+
+
+def parse_sample_rates(value):
+    """Parse "path=percent,path=percent" into {path: fraction}"""
+    rates = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        path, _, percent = item.partition("=")
+        rates[path.strip()] = float(percent) / 100
+    return rates
+
+
+class ProfilingMiddleware:
+    """ASGI middleware running selected requests under cProfile"""
+
+    def __init__(self, app, enabled=None, token=None, profile_dir=None, sample_rates=None):
+        self.app = app
+        self.enabled = settings.PROFILING_ENABLED if enabled is None else enabled
+        self.token = settings.PROFILING_TOKEN if token is None else token
+        self.profile_dir = settings.PROFILE_DIR if profile_dir is None else profile_dir
+        self.sample_rates = parse_sample_rates(
+            settings.PROFILE_SAMPLE_RATES if sample_rates is None else sample_rates
+        )
+
+    def _requested(self, scope):
+        if not self.token:
+            return False
+        headers = dict(scope.get("headers", []))
+        supplied = headers.get(PROFILE_HEADER.lower().encode(), b"").decode()
+        if not supplied:
+            supplied = parse_qs(scope.get("query_string", b"").decode()).get(PROFILE_QUERY_PARAM, [""])[0]
+        return bool(supplied) and hmac.compare_digest(supplied, self.token)
+
+    def _sampled(self, scope):
+        rate = self.sample_rates.get(scope["path"])
+        return rate is not None and random.random() < rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        if not (self._requested(scope) or self._sampled(scope)):
+            await self.app(scope, receive, send)
+            return
+        if not _session_lock.acquire(blocking=False):
+            # Another request is already being profiled
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(self.profile_dir)
+        token = _current_session.set(session)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER.lower().encode(), session.id.encode()))
+                message["headers"] = headers
+            await send(message)
+
+        session.profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            session.profiler.disable()
+            _current_session.reset(token)
+            _session_lock.release()
+            # Merging and writing the stats is file I/O; keep it off the event loop
+            await asyncio.to_thread(session.dump)
@@ -1,6 +1,7 @@
 """Module to define Pydantic schemas for models used"""
 from typing import Optional
-from pydantic import BaseModel, EmailStr
+from typing_extensions import TypedDict
+from pydantic import BaseModel, ConfigDict, EmailStr
 
 
 class BookBase(BaseModel):
@@ -18,8 +19,23 @@ class BookResponse(BookBase):
     """Pydantic schema for Book Response model"""
     id: int
 
-    class Config:
-        orm_mode = True  # Allows SQLAlchemy models to be used with Pydantic
+    model_config = ConfigDict(from_attributes=True)  # Allows SQLAlchemy models to be used with Pydantic
+
+class BookRow(TypedDict):
+    """Plain row shape of BookResponse, used by the fast list serialization path"""
+    id: int
+    title: str
+    author: str
+    genre: str
+    year_published: int
+    summary: Optional[str]
+
+class SimilarBookResponse(BaseModel):
+    """Pydantic schema for one entry of a book's similar books"""
+    id: int
+    title: str
+    author: str
+    score: float
 
 class BookUpdate(BaseModel):
     title: Optional[str] = None
@@ -29,8 +45,7 @@ class BookUpdate(BaseModel):
     year_published: Optional[int] = None
     # Add other fields if needed
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ReviewBase(BaseModel):
     """Pydantic schema for Review model"""
@@ -46,16 +61,22 @@ class ReviewResponse(ReviewBase):
     book_id: int
     user_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class ReviewRow(TypedDict):
+    """Plain row shape of ReviewResponse, used by the fast list serialization path"""
+    id: int
+    book_id: int
+    user_id: int
+    rating: float
+    review_text: Optional[str]
 
 # Pydantic schema for User model
 class UserBase(BaseModel):
     """Pydantic schema for User model"""
     username: str
     email: str
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UserCreate(BaseModel):
     """Pydantic schema for User Create model"""
@@ -85,8 +106,7 @@ class SummaryResponse(BaseModel):
     """Pydantic schema for Summary Response (response after generating the summary)"""
     summary: str  # The generated summary text
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class RecommendationRequest(BaseModel):
     """Pydantic schema for Recommendation request"""
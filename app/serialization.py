@@ -0,0 +1,51 @@
+"""Module to serialize large result lists quickly and stream them as NDJSON"""
+from typing import List
+import orjson
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
+from app.models import Book, Review
+from app.schemas import BookRow, ReviewRow
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+JSON_MEDIA_TYPE = "application/json"
+STREAM_BATCH_SIZE = 1000
+
+# Built once at import; building a TypeAdapter per request would rebuild its validator
+book_row_adapter = TypeAdapter(BookRow)
+book_rows_adapter = TypeAdapter(List[BookRow])
+review_row_adapter = TypeAdapter(ReviewRow)
+review_rows_adapter = TypeAdapter(List[ReviewRow])
+
+# Only the response columns are selected so rows skip ORM identity-map bookkeeping
+BOOK_COLUMNS = tuple(getattr(Book, name) for name in BookRow.__annotations__)
+REVIEW_COLUMNS = tuple(getattr(Review, name) for name in ReviewRow.__annotations__)
+
+
+def wants_ndjson(request: Request) -> bool:
+    """Check whether the client asked for an NDJSON stream"""
+    if request.query_params.get("format") == "ndjson":
+        return True
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def rows_response(rows, adapter: TypeAdapter) -> Response:
+    """Validate plain rows with a pre-built adapter and encode them with orjson"""
+    rows = [dict(row) for row in rows]
+    return Response(content=orjson.dumps(adapter.validate_python(rows)), media_type=JSON_MEDIA_TYPE)
+
+
+async def _ndjson_lines(session_factory, statement, adapter: TypeAdapter, batch_size):
+    # The request's session is closed before a streaming body is sent, so the
+    # stream owns its session for as long as the cursor is open.
+    async with session_factory() as session:
+        result = await session.stream(statement.execution_options(yield_per=batch_size))
+        async for partition in result.mappings().partitions():
+            yield b"".join(orjson.dumps(adapter.validate_python(dict(row))) + b"\n" for row in partition)
+
+
+def ndjson_response(session_factory, statement, adapter: TypeAdapter, batch_size=STREAM_BATCH_SIZE) -> StreamingResponse:
+    """Stream rows off a server-side cursor as NDJSON, holding one batch in memory at a time"""
+    return StreamingResponse(
+        _ndjson_lines(session_factory, statement, adapter, batch_size), media_type=NDJSON_MEDIA_TYPE
+    )
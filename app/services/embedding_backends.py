@@ -0,0 +1,119 @@
+"""Module to load the embedding model for the configured backend"""
+import bisect
+import numpy as np
+from app.config import settings
+
+# Backends that run the model in this process
+LOCAL_BACKENDS = ("local", "int8", "onnx")
+
+
+def set_torch_threads(num_threads):
+    """Limit torch intra-op threads; 0 keeps torch's default"""
+    if num_threads:
+        import torch
+        torch.set_num_threads(int(num_threads))
+
+
+def parse_buckets(value):
+    """Parse "32,64,128" into sorted token-length bucket bounds"""
+    return sorted(int(item) for item in (value or "").split(",") if item.strip())
+
+
+class BucketedEncoder:
+    """
+    Wrap a SentenceTransformer so texts are encoded in token-length buckets.
+    Short texts share large batches and long texts get small ones, so each batch
+    pads to a similar length and holds a similar number of tokens.
+    """
+
+    def __init__(self, model, buckets, batch_tokens):
+        self.model = model
+        self.buckets = [bound for bound in buckets if bound < model.max_seq_length] + [model.max_seq_length]
+        self.batch_tokens = batch_tokens
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def token_lengths(self, texts):
+        encoded = self.model.tokenizer(texts, truncation=True, max_length=self.model.max_seq_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def encode(self, sentences, convert_to_tensor=False, **kwargs):
+        """Encode like SentenceTransformer.encode, always returning a float32 numpy array"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        kwargs.pop("batch_size", None)
+        kwargs.pop("convert_to_numpy", None)
+
+        groups = {}
+        for index, length in enumerate(self.token_lengths(texts)):
+            bound = self.buckets[min(bisect.bisect_left(self.buckets, length), len(self.buckets) - 1)]
+            groups.setdefault(bound, []).append(index)
+
+        vectors = np.empty((len(texts), self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        for bound, indices in groups.items():
+            vectors[indices] = self.model.encode(
+                [texts[i] for i in indices],
+                batch_size=max(1, self.batch_tokens // bound),
+                convert_to_numpy=True,
+                **kwargs,
+            )
+        return vectors[0] if single else vectors
+
+
+def _onnx_model_kwargs(num_threads):
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise RuntimeError("The onnx embedding backend needs `pip install optimum[onnxruntime]`") from e
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    if num_threads:
+        options.intra_op_num_threads = int(num_threads)
+        options.inter_op_num_threads = 1
+    return {"provider": "CPUExecutionProvider", "session_options": options}
+
+
+def load_local_model(backend="local", num_threads=None):
+    """
+    Load the model in this process: "local" runs the float torch model, "int8"
+    applies torch dynamic quantization to its Linear layers, and "onnx" runs an
+    exported ONNX graph on onnxruntime's CPU provider.
+    """
+    from sentence_transformers import SentenceTransformer
+    num_threads = settings.TORCH_NUM_THREADS if num_threads is None else num_threads
+    set_torch_threads(num_threads)
+
+    if backend == "onnx":
+        model = SentenceTransformer(
+            settings.EMBEDDING_MODEL, device="cpu", backend="onnx", model_kwargs=_onnx_model_kwargs(num_threads)
+        )
+    elif backend == "int8":
+        import torch
+        model = SentenceTransformer(settings.EMBEDDING_MODEL, device="cpu")
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    else:
+        model = SentenceTransformer(settings.EMBEDDING_MODEL)
+
+    if settings.EMBEDDING_MAX_SEQ_LENGTH:
+        model.max_seq_length = int(settings.EMBEDDING_MAX_SEQ_LENGTH)
+    buckets = parse_buckets(settings.EMBEDDING_LENGTH_BUCKETS)
+    if buckets:
+        return BucketedEncoder(model, buckets, settings.EMBEDDING_BATCH_TOKENS)
+    return model
+
+
+def load_embedding_model(backend=None):
+    """
+    Return an object exposing SentenceTransformer's `encode` for the backend:
+    "local", "int8" and "onnx" load the model in-process, "remote" talks to the
+    shared embedding server.
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend in LOCAL_BACKENDS:
+        return load_local_model(backend)
+    if backend == "remote":
+        from app.services.embedding_server import EmbeddingClient
+        return EmbeddingClient(settings.EMBEDDING_SOCKET)
+    raise ValueError(f"Unknown embedding backend: {backend}")
@@ -0,0 +1,196 @@
+"""
+Module to store versioned catalog embeddings on disk.
+
+    <EMBEDDING_INDEX_DIR>/
+        current -> versions/<version>       symlink, swapped atomically
+        versions/<version>/
+            checkpoint.json                 progress of an in-flight build
+            pages/page-<first id>.npz       vectors written while building
+            ids.npy, vectors.npy            final index, memory-mappable
+            digests.npy                     fingerprint of each book's embedded text
+            manifest.json                   written last; marks the version complete
+"""
+import json
+import os
+import re
+import time
+import numpy as np
+
+CURRENT = "current"
+VERSIONS = "versions"
+MANIFEST = "manifest.json"
+CHECKPOINT = "checkpoint.json"
+
+
+def _tmp_path(path):
+    return f"{path}.tmp-{os.getpid()}"
+
+
+def _replace_synced(tmp_path, path):
+    with open(tmp_path, "rb+") as handle:
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def _write_atomic(path, write):
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "wb") as handle:
+        write(handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_json(path, payload):
+    _write_atomic(path, lambda handle: handle.write(json.dumps(payload, indent=2).encode()))
+
+
+def read_json(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+class IndexVersion:
+    """One build of the catalog embeddings"""
+
+    def __init__(self, index_dir, version):
+        self.version = version
+        self.path = os.path.join(index_dir, VERSIONS, version)
+        self.pages_path = os.path.join(self.path, "pages")
+
+    @property
+    def complete(self):
+        return os.path.exists(os.path.join(self.path, MANIFEST))
+
+    def load_checkpoint(self):
+        path = os.path.join(self.path, CHECKPOINT)
+        return read_json(path) if os.path.exists(path) else None
+
+    def save_checkpoint(self, checkpoint):
+        os.makedirs(self.path, exist_ok=True)
+        write_json(os.path.join(self.path, CHECKPOINT), checkpoint)
+
+    def write_page(self, first_id, ids, vectors, digests=None):
+        os.makedirs(self.pages_path, exist_ok=True)
+        path = os.path.join(self.pages_path, f"page-{first_id:012d}.npz")
+        arrays = {"ids": ids, "vectors": vectors}
+        if digests is not None:
+            arrays["digests"] = digests
+        _write_atomic(path, lambda handle: np.savez(handle, **arrays))
+        return os.path.basename(path)
+
+    def finalize(self, pages, manifest):
+        """
+        Copy checkpointed pages into memory-mappable arrays and write the
+        manifest. Vectors are written straight into a memory-mapped file, so
+        only one page is held in memory at a time.
+        """
+        ids, digests = [], []
+        for page in pages:
+            # Members of an .npz are read lazily: this loads ids and digests, not vectors
+            with np.load(os.path.join(self.pages_path, page)) as data:
+                ids.append(data["ids"])
+                digests.append(data["digests"] if "digests" in data else None)
+        ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+
+        vectors_path = os.path.join(self.path, "vectors.npy")
+        tmp_path = _tmp_path(vectors_path)
+        vectors = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float32, shape=(len(ids), manifest.get("dimension", 0))
+        )
+        row = 0
+        for page in pages:
+            with np.load(os.path.join(self.pages_path, page)) as data:
+                page_vectors = data["vectors"]
+                vectors[row:row + len(page_vectors)] = page_vectors
+                row += len(page_vectors)
+        vectors.flush()
+        del vectors
+        _replace_synced(tmp_path, vectors_path)
+
+        _write_atomic(os.path.join(self.path, "ids.npy"), lambda handle: np.save(handle, ids))
+        if all(page_digests is not None for page_digests in digests):
+            digests = np.concatenate(digests) if digests else np.empty(0, dtype=np.int64)
+            _write_atomic(os.path.join(self.path, "digests.npy"), lambda handle: np.save(handle, digests))
+        write_json(os.path.join(self.path, MANIFEST), {**manifest, "count": int(len(ids)), "finished_at": time.time()})
+
+
+def slug(value):
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", value).strip("-")
+
+
+def new_version(index_dir, model_name):
+    version = f"{slug(model_name)}-{time.strftime('%Y%m%d%H%M%S')}"
+    return IndexVersion(index_dir, version)
+
+
+def _builds_of(checkpoint, model_name, backend):
+    return bool(checkpoint) and checkpoint.get("model") == model_name and checkpoint.get("backend") == backend
+
+
+def find_incomplete_version(index_dir, model_name, backend):
+    """Return the newest unfinished build for `model_name` encoded with `backend`, if any"""
+    versions_dir = os.path.join(index_dir, VERSIONS)
+    if not os.path.isdir(versions_dir):
+        return None
+    for version in sorted(os.listdir(versions_dir), reverse=True):
+        candidate = IndexVersion(index_dir, version)
+        if _builds_of(candidate.load_checkpoint(), model_name, backend) and not candidate.complete:
+            return candidate
+    return None
+
+
+def find_unactivated_version(index_dir, model_name, backend):
+    """
+    Return the newest complete build that was meant to be activated but never
+    was, e.g. because the job stopped between finishing and swapping it in.
+    Builds older than the active version are never returned.
+    """
+    versions_dir = os.path.join(index_dir, VERSIONS)
+    if not os.path.isdir(versions_dir):
+        return None
+    active = current_version(index_dir)
+    for version in sorted(os.listdir(versions_dir), reverse=True):
+        if version == active:
+            return None
+        candidate = IndexVersion(index_dir, version)
+        checkpoint = candidate.load_checkpoint()
+        if _builds_of(checkpoint, model_name, backend) and checkpoint.get("activate") and candidate.complete:
+            return candidate
+    return None
+
+
+def activate(index_dir, version):
+    """Atomically point `current` at a completed version"""
+    if not version.complete:
+        raise ValueError(f"Index version {version.version} is not complete")
+    link_path = os.path.join(index_dir, CURRENT)
+    tmp_link = f"{link_path}.tmp-{os.getpid()}"
+    os.symlink(os.path.join(VERSIONS, version.version), tmp_link)
+    os.replace(tmp_link, link_path)
+
+
+def current_version(index_dir):
+    """Name of the active version, read from the `current` link alone; None if none is active"""
+    try:
+        return os.path.basename(os.readlink(os.path.join(index_dir, CURRENT)))
+    except OSError:
+        return None
+
+
+def load_current(index_dir, mmap_mode="r"):
+    """Return (ids, vectors, manifest) of the active version, or None if none is active"""
+    path = os.path.join(index_dir, CURRENT)
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        return None
+    ids = np.load(os.path.join(path, "ids.npy"), mmap_mode=mmap_mode)
+    vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+    return ids, vectors, read_json(os.path.join(path, MANIFEST))
+
+
+def load_digests(index_dir, ids):
+    """{id: text digest} of the active version; empty for versions built before digests were stored"""
+    path = os.path.join(index_dir, CURRENT, "digests.npy")
+    if not os.path.exists(path):
+        return {}
+    return dict(zip(np.asarray(ids).tolist(), np.load(path).tolist()))
@@ -0,0 +1,109 @@
+"""
+Module to check that a faster embedding backend matches the float model.
+
+    python -m app.services.embedding_parity --backend int8 --limit 2000
+
+Compares embeddings of catalog books from the untruncated float model and the
+candidate backend (with its configured truncation and bucketing), and the
+top-k books each retrieves for the same queries. Exits non-zero when the
+candidate backend falls below the cosine or recall thresholds.
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.future import select
+from app.config import settings
+from app.models import Book
+from app.services.embedding_backends import LOCAL_BACKENDS, load_local_model
+from app.services.recommendation_engine import book_text
+
+
+def _encode(model, texts):
+    start = time.perf_counter()
+    vectors = np.asarray(model.encode(texts, convert_to_numpy=True), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms, elapsed
+
+
+def _top_k(queries, corpus, k):
+    scores = queries @ corpus.T
+    k = min(k, corpus.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def check_parity(reference, candidate, corpus, queries, k=10):
+    """Compare `candidate` against `reference` on the same corpus and queries"""
+    reference_corpus, reference_seconds = _encode(reference, corpus)
+    candidate_corpus, candidate_seconds = _encode(candidate, corpus)
+    cosines = np.sum(reference_corpus * candidate_corpus, axis=1)
+
+    reference_queries, _ = _encode(reference, queries)
+    candidate_queries, _ = _encode(candidate, queries)
+    reference_top = _top_k(reference_queries, reference_corpus, k)
+    candidate_top = _top_k(candidate_queries, candidate_corpus, k)
+    recall = np.mean([len(ref & cand) / len(ref) for ref, cand in zip(reference_top, candidate_top)])
+
+    return {
+        "mean_cosine": float(np.mean(cosines)),
+        "min_cosine": float(np.min(cosines)),
+        f"recall_at_{k}": float(recall),
+        "reference_seconds": reference_seconds,
+        "candidate_seconds": candidate_seconds,
+        "speedup": reference_seconds / candidate_seconds if candidate_seconds else float("inf"),
+    }
+
+
+def load_reference_model():
+    """
+    The float model as deployed by default: its own max_seq_length (256
+    tokens for all-MiniLM-L6-v2), without EMBEDDING_MAX_SEQ_LENGTH or length
+    bucketing, so accuracy lost to either shows up in the report.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(settings.EMBEDDING_MODEL, device="cpu")
+
+
+async def fetch_sample(limit):
+    """Fetch book texts and title queries for the comparison"""
+    engine = create_async_engine(settings.DATABASE_URL)
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(Book.title, Book.author, Book.genre, Book.year_published, Book.summary)
+                .order_by(Book.id).limit(limit)
+            )
+            rows = result.all()
+    finally:
+        await engine.dispose()
+    return [book_text(row) for row in rows], [f"{row.genre} book like {row.title}" for row in rows[::10]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check an embedding backend against the float model")
+    parser.add_argument("--backend", default="int8", choices=LOCAL_BACKENDS)
+    parser.add_argument("--limit", type=int, default=2000, help="books to compare")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--min-recall", type=float, default=0.90)
+    args = parser.parse_args(argv)
+
+    corpus, queries = asyncio.run(fetch_sample(args.limit))
+    if not corpus:
+        raise SystemExit("No books to compare")
+    report = check_parity(load_reference_model(), load_local_model(args.backend), corpus, queries, args.k)
+    for name, value in report.items():
+        print(f"{name:20s} {value:.4f}")
+
+    passed = report["min_cosine"] >= args.min_cosine and report[f"recall_at_{args.k}"] >= args.min_recall
+    print("PASS" if passed else "FAIL")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,231 @@
+"""
+Module to share one embedding model between API worker processes.
+
+The server process owns the SentenceTransformer model and listens on a Unix
+socket. Clients keep a small pool of connections, each with a fixed-size
+shared memory block; the server writes the float32 vectors straight into it,
+so only the texts and a small reply cross the socket. Large inputs are sent
+in chunks that fit the block. Start it with:
+
+    python -m app.services.embedding_server --socket /tmp/book-embeddings.sock --threads 4
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from app.config import settings
+
+_HEADER = struct.Struct("!I")
+# Texts per encode request; bounds each connection's shared block to chunk_size * dimension * 4 bytes
+DEFAULT_CHUNK_SIZE = 256
+
+
+def _send_frame(sock, payload):
+    data = json.dumps(payload).encode()
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Embedding server connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_frame(sock):
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return json.loads(_recv_exactly(sock, size))
+
+
+def _attach(name):
+    """Attach to a client's block without letting this process's resource tracker unlink it"""
+    block = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    """Serve encode requests for one client connection"""
+
+    def handle(self):
+        block = None
+        try:
+            while True:
+                try:
+                    request = _recv_frame(self.request)
+                except ConnectionError:
+                    return
+                try:
+                    if request["op"] == "info":
+                        _send_frame(self.request, {"dimension": self.server.dimension})
+                        continue
+                    if block is None or block.name != request["shm"]:
+                        if block is not None:
+                            block.close()
+                        block = _attach(request["shm"])
+                    with self.server.encode_lock:
+                        vectors = self.server.model.encode(request["texts"], convert_to_numpy=True)
+                    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+                    if vectors.nbytes > block.size:
+                        raise ValueError(f"Shared buffer of {block.size} bytes cannot hold {vectors.nbytes} bytes")
+                    np.ndarray(vectors.shape, dtype=np.float32, buffer=block.buf)[...] = vectors
+                    _send_frame(self.request, {"shape": list(vectors.shape)})
+                except Exception as e:
+                    _send_frame(self.request, {"error": str(e)})
+        finally:
+            if block is not None:
+                block.close()
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server holding the only copy of the embedding model"""
+    daemon_threads = True
+
+    def __init__(self, socket_path, model):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, EmbeddingRequestHandler)
+        os.chmod(socket_path, 0o660)
+        self.model = model
+        self.dimension = model.get_sentence_embedding_dimension()
+        self.encode_lock = threading.Lock()
+
+
+class _Connection:
+    """Socket plus the shared memory block it receives vectors in"""
+
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.block = None
+
+    def ensure_capacity(self, size):
+        if self.block is not None and self.block.size >= size:
+            return
+        self.release_block()
+        self.block = shared_memory.SharedMemory(create=True, size=size)
+
+    def release_block(self):
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+    def close(self):
+        self.sock.close()
+        self.release_block()
+
+
+class EmbeddingClient:
+    """
+    Drop-in for SentenceTransformer.encode backed by the embedding server.
+    Always returns a float32 numpy array so API workers never need to import torch.
+
+    Connections are borrowed from a pool shared by all threads. At most
+    `max_idle` are kept open between calls, so shared memory stays bounded
+    by `max_idle * chunk_size * dimension * 4` bytes however many threads
+    have used the client.
+    """
+
+    def __init__(self, socket_path, chunk_size=DEFAULT_CHUNK_SIZE, max_idle=4):
+        self.socket_path = socket_path
+        self.chunk_size = chunk_size
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._dimension = None
+
+    @contextmanager
+    def _connection(self):
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is None:
+            connection = _Connection(self.socket_path)
+        try:
+            yield connection
+        except BaseException:
+            connection.close()
+            raise
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def _request(self, payload, buffer_size=0):
+        """Send one request, reconnecting once if the server was restarted"""
+        for attempt in range(2):
+            try:
+                with self._connection() as connection:
+                    if buffer_size:
+                        connection.ensure_capacity(buffer_size)
+                        payload["shm"] = connection.block.name
+                    _send_frame(connection.sock, payload)
+                    reply = _recv_frame(connection.sock)
+                    if buffer_size and "error" not in reply:
+                        shape = tuple(reply["shape"])
+                        reply["vectors"] = np.ndarray(shape, dtype=np.float32, buffer=connection.block.buf).copy()
+                break
+            except (ConnectionError, OSError):
+                # Idle connections to a restarted server are stale as well
+                self.close()
+                if attempt:
+                    raise
+        if "error" in reply:
+            raise RuntimeError(f"Embedding server error: {reply['error']}")
+        return reply
+
+    def get_sentence_embedding_dimension(self):
+        if self._dimension is None:
+            self._dimension = self._request({"op": "info"})["dimension"]
+        return self._dimension
+
+    def encode(self, sentences, convert_to_tensor=False, **kwargs):
+        """Encode `sentences` remotely; extra SentenceTransformer options are ignored"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        dimension = self.get_sentence_embedding_dimension()
+        if not texts:
+            return np.empty((0, dimension), dtype=np.float32)
+        buffer_size = self.chunk_size * dimension * 4
+        vectors = np.concatenate([
+            self._request({"op": "encode", "texts": texts[start:start + self.chunk_size]}, buffer_size)["vectors"]
+            for start in range(0, len(texts), self.chunk_size)
+        ])
+        return vectors[0] if single else vectors
+
+    def close(self):
+        """Close the idle connections and free their shared buffers"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+def main(argv=None):
+    from app.services.embedding_backends import LOCAL_BACKENDS, load_local_model
+
+    parser = argparse.ArgumentParser(description="Serve the embedding model to API workers over a Unix socket")
+    parser.add_argument("--socket", default=settings.EMBEDDING_SOCKET)
+    parser.add_argument("--threads", type=int, default=settings.EMBEDDING_SERVER_THREADS, help="torch intra-op threads")
+    parser.add_argument("--backend", default="local", choices=LOCAL_BACKENDS)
+    args = parser.parse_args(argv)
+
+    model = load_local_model(args.backend, num_threads=args.threads)
+    with EmbeddingServer(args.socket, model) as server:
+        print(f"Embedding server for {settings.EMBEDDING_MODEL} listening on {args.socket}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
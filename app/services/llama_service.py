@@ -1,20 +1,105 @@
 """Module to handle summary generation"""
+import asyncio
 import concurrent.futures
 import math
+import threading
+import time
+from contextlib import contextmanager
+import httpx
 import ollama
 from app.config import settings
+from app import metrics
+from app.profiling import profile_in_thread
+
+# Summarization stages: many parallel chunk summaries, then one final pass over them
+MAP = "map"
+REDUCE = "reduce"
+
+
+def _parse_value(value):
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_options(value):
+    """Parse "num_predict=256,num_ctx=4096" into Ollama generation options"""
+    options = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        name, _, option = item.partition("=")
+        options[name.strip()] = _parse_value(option.strip())
+    return options
+
 
 class LlamaService:
     _instance = None
+    _client = None
+    _transport = None
+    _slots = None
+    _client_lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(LlamaService, cls).__new__(cls)
         return cls._instance
-    
-    def summarize_chunk(self, chunk):
+
+    @property
+    def client(self):
+        """
+        One Ollama client per process, reusing pooled keep-alive connections
+        across calls. The pool holds OLLAMA_MAX_CONNECTIONS connections, shared
+        by every concurrent summary request in this process.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    connections = int(settings.OLLAMA_MAX_CONNECTIONS)
+                    # We own the transport (and its connection pool) so we can close it ourselves
+                    transport = httpx.HTTPTransport(
+                        limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+                    )
+                    LlamaService._slots = threading.BoundedSemaphore(connections)
+                    LlamaService._transport = transport
+                    LlamaService._client = ollama.Client(host=settings.OLLAMA_HOST or None, transport=transport)
+        return self._client
+
+    @contextmanager
+    def _connection_slot(self):
+        """Wait for a free pool connection, recording the wait and giving up after OLLAMA_POOL_TIMEOUT"""
+        started = time.perf_counter()
+        timeout = float(settings.OLLAMA_POOL_TIMEOUT) or None
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No Ollama connection became free within {timeout}s")
+        metrics.stage_duration.observe(time.perf_counter() - started, metrics.LLM_CONNECTION_WAIT)
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._client_lock:
+            if self._transport is not None:
+                self._transport.close()
+            LlamaService._client = None
+            LlamaService._transport = None
+
+    def stage_model(self, stage):
+        """Model for a stage, falling back to OLLAMA_MODEL"""
+        model = settings.OLLAMA_REDUCE_MODEL if stage == REDUCE else settings.OLLAMA_MAP_MODEL
+        return model or settings.OLLAMA_MODEL
+
+    def stage_options(self, stage):
+        options = parse_options(settings.OLLAMA_REDUCE_OPTIONS if stage == REDUCE else settings.OLLAMA_MAP_OPTIONS)
+        return options or None
+
+    def summarize_chunk(self, chunk, stage=MAP):
         """Generate summary of chunk"""
-        model = settings.OLLAMA_MODEL
+        model = self.stage_model(stage)
         messages = [{
             "role":"system",
             "content": "Generate a brief summary for the provided content from a book."
@@ -24,10 +109,15 @@ class LlamaService:
             "content": chunk
         }]
 
-        response = ollama.chat(
-            model = model,
-            messages = messages
-        )
+        client = self.client
+        with self._connection_slot(), metrics.stage_timer(metrics.LLM_SUMMARIZE_CHUNK):
+            response = client.chat(
+                model = model,
+                messages = messages,
+                options = self.stage_options(stage),
+                # Keep the stage models resident between calls instead of reloading them
+                keep_alive = _parse_value(settings.OLLAMA_KEEP_ALIVE) if settings.OLLAMA_KEEP_ALIVE else None,
+            )
         # Assuming the output is directly the summary in JSON format
         summary = response['message']['content']
         print(summary)
@@ -42,30 +132,60 @@ class LlamaService:
         chunks = [book_text[i * chunk_size: (i + 1) * chunk_size] for i in range(num_chunks)]
         return chunks
 
-    def generate_book_summary(self, book_text):
+    def _run_queued(self, submitted_at, fn, *args):
+        """Run `fn` in an executor thread, recording how long it waited for a worker"""
+        metrics.stage_duration.observe(time.perf_counter() - submitted_at, metrics.EXECUTOR_QUEUE_WAIT)
+        return fn(*args)
+
+    def summarize_book(self, book_text):
         """
         Generate a summary for the entire book by processing chunks in parallel.
+        Returns the summary and the wall time, model and call count of each stage.
         """
         # Step 1: Chunk the text into manageable parts
         chunks = self.chunk_text(book_text)
         
         # Step 2: Use concurrent processing to summarize each chunk
+        map_started = time.perf_counter()
         with concurrent.futures.ThreadPoolExecutor(max_workers=settings.MAX_WORKERS) as executor:
             # Map summarize_chunk function to each chunk in parallel
-            summaries = list(executor.map(self.summarize_chunk, chunks))
+            run_queued = profile_in_thread(self._run_queued)
+            futures = [
+                executor.submit(run_queued, time.perf_counter(), self.summarize_chunk, chunk, MAP)
+                for chunk in chunks
+            ]
+            summaries = [future.result() for future in futures]
+        map_seconds = time.perf_counter() - map_started
+        metrics.llm_stage_duration.observe(map_seconds, MAP, self.stage_model(MAP))
+        metrics.llm_calls.inc(len(chunks), MAP, self.stage_model(MAP))
         
         # Step 3: Aggregate the summaries from each chunk
         # This could be further summarized if the book is large
         final_summary = "\n".join(summaries)  # Concatenate all chunk summaries
         
-        # Optional: You can further summarize the collected summaries
-        final_summary = self.summarize_chunk(final_summary)  # Summarize the aggregated summaries
+        # Summarize the aggregated summaries, usually with the stronger reduce model
+        reduce_started = time.perf_counter()
+        final_summary = self.summarize_chunk(final_summary, REDUCE)
+        reduce_seconds = time.perf_counter() - reduce_started
+        metrics.llm_stage_duration.observe(reduce_seconds, REDUCE, self.stage_model(REDUCE))
+        metrics.llm_calls.inc(1, REDUCE, self.stage_model(REDUCE))
+
+        timings = {
+            MAP: {"model": self.stage_model(MAP), "calls": len(chunks), "seconds": map_seconds},
+            REDUCE: {"model": self.stage_model(REDUCE), "calls": 1, "seconds": reduce_seconds},
+        }
+        return final_summary, timings
+
+    def generate_book_summary(self, book_text):
+        """Generate a summary for the entire book; stage timings are reported through metrics"""
+        final_summary, _ = self.summarize_book(book_text)
         return final_summary
 
     async def generate_summary(self, content: str) -> str:
         """Main driver function"""
         try:
-            return self.generate_book_summary(content)
+            # Run off the event loop so other requests (and coalesced duplicates) keep flowing
+            return await asyncio.to_thread(profile_in_thread(self.generate_book_summary), content)
             
         except Exception as e:
             raise Exception(f"Ollama model error: {e}")
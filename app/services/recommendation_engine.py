@@ -1,44 +1,148 @@
 """Module to handle recommendation engine"""
-from sentence_transformers import SentenceTransformer
+import asyncio
+import hashlib
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-from app.config import settings
+from app.services.embedding_backends import load_embedding_model
+from app.metrics import stage_timer, EMBEDDING_ENCODE, SIMILARITY_SCORING
+from app.services import sharded_search
+from app.profiling import profile_in_thread
 
 
-# Initialize the embedding model 
-embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+_embedding_model = None
+
+
+def get_embedding_model():
+    """Load the embedding model on first use"""
+    global _embedding_model
+    if _embedding_model is None:
+        _embedding_model = load_embedding_model()
+    return _embedding_model
+
+
+def set_embedding_model(model):
+    """Replace the embedding model, e.g. with a deterministic local stand-in"""
+    global _embedding_model
+    _embedding_model = model
+
+
+def book_text(book):
+    """Concatenate relevant fields for the embedding (summary, title, author, genre)"""
+    return f"{book.title} {book.author} {book.genre} {book.year_published} {book.summary}"
+
+
+async def fetch_book_texts(book_ids=None):
+    """Return (ids, texts) of the given books, or of the whole catalog"""
+    from sqlalchemy.future import select
+    from app.database import async_session
+    from app.models import Book
+
+    statement = select(Book.id, Book.title, Book.author, Book.genre, Book.year_published, Book.summary)
+    if book_ids is not None:
+        statement = statement.where(Book.id.in_(book_ids))
+    async with async_session() as session:
+        rows = (await session.execute(statement.order_by(Book.id))).all()
+    return [row.id for row in rows], [book_text(row) for row in rows]
+
+
+async def fetch_titles(book_ids):
+    """Return {id: title} of the given books that still exist"""
+    from sqlalchemy.future import select
+    from app.database import async_session
+    from app.models import Book
+
+    if not book_ids:
+        return {}
+    async with async_session() as session:
+        rows = (await session.execute(select(Book.id, Book.title).where(Book.id.in_(book_ids)))).all()
+    return {row.id: row.title for row in rows}
+
+
+def text_digest(text):
+    """64-bit fingerprint of a book's embedding text, to tell whether its vector is stale"""
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little", signed=True)
+
+
+async def stale_books(embedded):
+    """
+    Compare {id: text digest} of the vectors held in memory with the database.
+    Returns (ids, texts) of the books to embed again, and the ids of deleted books.
+    """
+    ids, texts = await fetch_book_texts()
+    stale = [(book_id, text) for book_id, text in zip(ids, texts) if embedded.get(book_id) != text_digest(text)]
+    deleted = set(embedded) - set(ids)
+    return [book_id for book_id, _ in stale], [text for _, text in stale], deleted
+
+
+def encode_texts(texts):
+    """Encode texts into a float32 matrix"""
+    with stage_timer(EMBEDDING_ENCODE):
+        return np.asarray(get_embedding_model().encode(texts, convert_to_numpy=True), dtype=np.float32)
 
 
 def create_book_embeddings(books):
     """Create book embeddings using Embedding model"""
-    book_data = []
-    for book in books:
-        # Concatenate relevant fields for the embedding (summary, title, author, genre)
-        book_info = f"{book.title} {book.author} {book.genre} {book.year_published} {book.summary}"
-        book_data.append(book_info)
+    book_data = [book_text(book) for book in books]
     
     # Create embeddings for each book
-    embeddings = embedding_model.encode(book_data, convert_to_tensor=True)
+    with stage_timer(EMBEDDING_ENCODE):
+        embeddings = get_embedding_model().encode(book_data, convert_to_tensor=True)
     return embeddings
 
 def process_user_query(user_query, book_embeddings, books, top_n=2, threshold=0.9):
     """Create embedding for the user query"""
-    query_embedding = embedding_model.encode([user_query], convert_to_tensor=True)
+    with stage_timer(EMBEDDING_ENCODE):
+        query_embedding = get_embedding_model().encode([user_query], convert_to_tensor=True)
     
-    # Calculate cosine similarity between the query and each book's embedding
-    similarities = cosine_similarity(query_embedding, book_embeddings)
-    
-     # Filter books by the similarity threshold and get the top N indices
-    top_indices = [
-        i for i in np.argsort(similarities)[::-1]
-        if similarities[i] >= threshold
-    ][:top_n]  # Limit to the top N results that meet the threshold
+    with stage_timer(SIMILARITY_SCORING):
+        # Calculate cosine similarity between the query and each book's embedding
+        similarities = cosine_similarity(query_embedding, book_embeddings)[0]
+        
+         # Filter books by the similarity threshold and get the top N indices
+        top_indices = [
+            i for i in np.argsort(similarities)[::-1]
+            if similarities[i] >= threshold
+        ][:top_n]  # Limit to the top N results that meet the threshold
     
     
     # Get the top 2 matching book titles
     top_books = [books[i].title for i in top_indices]
     return top_books if top_books else ["No highly similar matches found."]
 
+def encode_query(user_query):
+    with stage_timer(EMBEDDING_ENCODE):
+        return get_embedding_model().encode([user_query], convert_to_numpy=True)
+
+
+def catalog_hits(query_embedding, k, threshold):
+    """[(id, score)] of the k best catalog matches at or above threshold; None when the catalog search is off"""
+    with sharded_search.catalog_search() as search:
+        if search is None:
+            return None
+        with stage_timer(SIMILARITY_SCORING):
+            return [(book_id, score) for book_id, score in search.search(query_embedding, k)[0] if score >= threshold]
+
+
+async def search_catalog(user_query, top_n=2, threshold=0.9):
+    """
+    Score the query against the precomputed catalog index, sharded across
+    worker processes, then look up the titles of the hits only
+    """
+    query_embedding = await asyncio.to_thread(profile_in_thread(encode_query), user_query)
+
+    # Over-fetch until top_n hits are books still in the database, so a stale or deleted id never hides a live match
+    k = top_n
+    while True:
+        hits = await asyncio.to_thread(profile_in_thread(catalog_hits), query_embedding, k, threshold) or []
+        titles = await fetch_titles([book_id for book_id, _ in hits])
+        live = [book_id for book_id, _ in hits if book_id in titles]
+        if len(live) >= top_n or len(hits) < k:
+            break
+        k += len(hits) - len(live)
+
+    top_books = [titles[book_id] for book_id in live[:top_n]]
+    return top_books if top_books else ["No highly similar matches found."]
+
 def recommend_books(user_query, books):
     """Recommendation orchestrator"""
     # Create embeddings for the books
@@ -0,0 +1,151 @@
+"""
+Module to re-embed the whole catalog offline.
+
+Books are streamed from PostgreSQL in id-ordered pages, encoded across a
+process pool, and checkpointed page by page. An interrupted run picks up
+after the last checkpointed page of a build with the same model and backend.
+When every page is written, the new index version is activated with an
+atomic symlink swap; a build that finished but was never swapped in is
+activated by the next run instead of being rebuilt. Run it with:
+
+    python -m app.services.reembed_job --workers 4 --page-size 2000
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.future import select
+from app.config import settings
+from app.models import Book
+from app.services import embedding_index
+from app.services.recommendation_engine import book_text, text_digest
+
+_worker_model = None
+
+
+def _init_worker(backend, num_threads):
+    """Load the embedding model once per pool process"""
+    global _worker_model
+    from app.services import embedding_backends
+
+    _worker_model = embedding_backends.load_embedding_model(backend)
+    embedding_backends.set_torch_threads(num_threads)
+
+
+def encode_page(first_id, ids, texts, batch_size):
+    """
+    Encode one page in length-sorted batches so each batch pads to similar
+    lengths, then restore the original id order.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    vectors = None
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        encoded = np.asarray(
+            _worker_model.encode([texts[i] for i in batch], batch_size=batch_size, convert_to_numpy=True),
+            dtype=np.float32,
+        )
+        if vectors is None:
+            vectors = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+        vectors[batch] = encoded
+    digests = np.array([text_digest(text) for text in texts], dtype=np.int64)
+    return first_id, np.asarray(ids, dtype=np.int64), vectors, digests
+
+
+async def iter_pages(engine, after_id, page_size):
+    """Yield (ids, texts) pages in id order using keyset pagination"""
+    columns = (Book.id, Book.title, Book.author, Book.genre, Book.year_published, Book.summary)
+    while True:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(*columns).where(Book.id > after_id).order_by(Book.id).limit(page_size)
+            )
+            rows = result.all()
+        if not rows:
+            return
+        yield [row.id for row in rows], [book_text(row) for row in rows]
+        after_id = rows[-1].id
+
+
+async def run_job(index_dir, workers, page_size, batch_size, backend, threads, activate=True):
+    model_name = settings.EMBEDDING_MODEL
+    if activate:
+        finished = embedding_index.find_unactivated_version(index_dir, model_name, backend)
+        if finished is not None:
+            # An earlier run stopped between finishing the build and swapping it in
+            embedding_index.activate(index_dir, finished)
+            print(f"Activated {finished.version}, finished by an earlier run")
+            return finished
+
+    version = embedding_index.find_incomplete_version(index_dir, model_name, backend)
+    if version is None:
+        version = embedding_index.new_version(index_dir, model_name)
+        checkpoint = {"model": model_name, "backend": backend, "last_id": 0, "pages": [], "started_at": time.time()}
+    else:
+        checkpoint = version.load_checkpoint()
+        print(f"Resuming {version.version} after book id {checkpoint['last_id']}")
+    checkpoint["activate"] = activate
+    version.save_checkpoint(checkpoint)
+
+    engine = create_async_engine(settings.DATABASE_URL)
+    loop = asyncio.get_running_loop()
+    max_in_flight = workers * 2
+    in_flight = []
+    dimension = checkpoint.get("dimension", 0)
+
+    def commit_page(first_id, ids, vectors, digests):
+        nonlocal dimension
+        page = version.write_page(first_id, ids, vectors, digests)
+        dimension = int(vectors.shape[1])
+        checkpoint["pages"].append(page)
+        checkpoint["last_id"] = int(ids[-1])
+        checkpoint["dimension"] = dimension
+        version.save_checkpoint(checkpoint)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(backend, threads)) as pool:
+            async for ids, texts in iter_pages(engine, checkpoint["last_id"], page_size):
+                in_flight.append(loop.run_in_executor(pool, encode_page, ids[0], ids, texts, batch_size))
+                # Pages are checkpointed strictly in id order so `last_id` is always a safe resume point
+                while len(in_flight) >= max_in_flight or (in_flight and in_flight[0].done()):
+                    commit_page(*await in_flight.pop(0))
+            while in_flight:
+                commit_page(*await in_flight.pop(0))
+    finally:
+        for future in in_flight:
+            future.cancel()
+        await engine.dispose()
+
+    version.finalize(checkpoint["pages"], {
+        "model": model_name,
+        "backend": backend,
+        "dimension": dimension,
+        "version": version.version,
+    })
+    if activate:
+        embedding_index.activate(index_dir, version)
+    print(f"Index version {version.version} complete with {len(checkpoint['pages'])} pages")
+    return version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-embed the catalog into a new index version")
+    parser.add_argument("--index-dir", default=settings.EMBEDDING_INDEX_DIR)
+    parser.add_argument("--workers", type=int, default=2, help="encoding processes")
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per encoding process")
+    parser.add_argument("--page-size", type=int, default=2000, help="books fetched per page")
+    parser.add_argument("--batch-size", type=int, default=64, help="texts per encode call")
+    parser.add_argument("--backend", default="local")
+    parser.add_argument("--no-activate", action="store_true", help="build the version without swapping it in")
+    args = parser.parse_args(argv)
+
+    asyncio.run(run_job(
+        args.index_dir, args.workers, args.page_size, args.batch_size,
+        args.backend, args.threads, activate=not args.no_activate,
+    ))
+
+
+if __name__ == "__main__":
+    main()
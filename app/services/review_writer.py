@@ -0,0 +1,124 @@
+"""Module to group-commit review writes"""
+import asyncio
+from sqlalchemy import insert
+from sqlalchemy.future import select
+from app.batching import next_batch
+from app.config import settings
+from app.database import async_session
+from app.events import event_bus, REVIEW, CREATED
+from app.models import Book, Review
+from app.serialization import REVIEW_COLUMNS
+
+
+_STOP = object()
+
+
+class BookNotFound(LookupError):
+    """Raised to a caller whose review targets a book that does not exist"""
+
+
+class ReviewBatchWriter:
+    """
+    Collect reviews from concurrent requests and write them with one multi-row
+    INSERT per batch. A batch is flushed when it reaches `max_batch` rows or
+    `max_delay_ms` after its first row, whichever comes first. Each caller's
+    `submit` resolves only once its batch is committed.
+    """
+
+    def __init__(self, session_factory, max_batch=None, max_delay_ms=None):
+        self.session_factory = session_factory
+        self.max_batch = max_batch or settings.REVIEW_BATCH_SIZE
+        self.max_delay = (max_delay_ms if max_delay_ms is not None else settings.REVIEW_BATCH_INTERVAL_MS) / 1000
+        self._queue = None
+        self._task = None
+        self._stopping = False
+        self._listeners = []
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def add_batch_listener(self, callback):
+        """Register `async callback(rows)`, called once per committed batch"""
+        self._listeners.append(callback)
+
+    async def start(self):
+        if not self.running:
+            self._queue = asyncio.Queue()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush the batch being collected and everything queued, then stop the writer"""
+        if not self.running:
+            return
+        # Reviews queued before the sentinel are flushed before the writer exits
+        self._stopping = True
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, book_id, user_id, review):
+        """Queue one review and wait until it is durably committed; returns the stored row"""
+        if not self.running or self._stopping:
+            raise RuntimeError("Review writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(({"book_id": book_id, "user_id": user_id, **review}, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = await next_batch(self._queue, self.max_batch, self.max_delay, stop_after=_STOP)
+            if batch[-1] is _STOP:
+                batch.pop()
+                if batch:
+                    await self._flush(batch)
+                return
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        try:
+            async with self.session_factory() as session:
+                book_ids = {values["book_id"] for values, _ in batch}
+                result = await session.execute(select(Book.id).where(Book.id.in_(book_ids)))
+                existing = set(result.scalars().all())
+
+                accepted = []
+                for values, future in batch:
+                    if values["book_id"] in existing:
+                        accepted.append((values, future))
+                    elif not future.done():
+                        future.set_exception(BookNotFound(values["book_id"]))
+                if not accepted:
+                    return
+
+                result = await session.execute(
+                    insert(Review).returning(*REVIEW_COLUMNS, sort_by_parameter_order=True),
+                    [values for values, _ in accepted],
+                )
+                rows = [dict(row) for row in result.mappings().all()]
+                await session.commit()
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Callers that disconnected still had their review stored; only live futures get a result
+        for (_, future), row in zip(accepted, rows):
+            if not future.done():
+                future.set_result(row)
+        for listener in self._listeners:
+            try:
+                await listener(rows)
+            except Exception as e:
+                print(f"Review batch listener failed: {e}")
+
+
+async def publish_review_batch(rows):
+    """Publish one change event per stored review, once per committed batch"""
+    await event_bus.publish_many(REVIEW, CREATED, [(row["id"], row["book_id"]) for row in rows])
+
+
+review_writer = ReviewBatchWriter(async_session)
+review_writer.add_batch_listener(publish_review_batch)
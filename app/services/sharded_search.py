@@ -0,0 +1,488 @@
+"""
+Module to run exact nearest-neighbour search across all cores.
+
+The normalized embedding matrix lives in one shared-memory block, next to a
+per-row live flag. A search splits the used rows into contiguous shards, one
+per worker process. Workers map the block instead of copying it. Each shard
+computes its own top-k over its live rows with a BLAS matrix product, and the
+per-shard lists are merged with a heap. Ties are broken by row order, so the
+result is identical to `exact_search` over the same live rows.
+
+The block has spare capacity: books are added or re-embedded in place and
+deleted books are masked, so the catalog search follows the change-event bus
+without being rebuilt. To measure scaling:
+
+    python -m app.services.sharded_search --rows 1000000 --dim 384 --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+import numpy as np
+from app.config import settings
+from app.events import DELETED
+from app.services import embedding_index
+
+_worker_block = None
+_worker_vectors = None
+_worker_live = None
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _row_top_k(scores, offset, k):
+    """Best k (row, score) pairs of one score vector, by score then row; exact at ties"""
+    if k < len(scores):
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))[:k]
+    chosen = candidates[order]
+    # Masked rows score -inf and are never returned
+    chosen = chosen[np.isfinite(scores[chosen])]
+    return list(zip((chosen + offset).tolist(), scores[chosen].tolist()))
+
+
+def _shard_top_k(vectors, live, start, stop, queries, k):
+    scores = queries @ vectors[start:stop].T
+    if live is not None:
+        scores[:, ~live[start:stop]] = -np.inf
+    return [_row_top_k(row, start, k) for row in scores]
+
+
+def _merge(shard_results, k):
+    """Merge per-shard lists, each already sorted best first, into the global top k per query"""
+    merged = []
+    for per_query in zip(*shard_results):
+        best = heapq.merge(*per_query, key=lambda hit: (-hit[1], hit[0]))
+        merged.append(list(itertools.islice(best, k)))
+    return merged
+
+
+def exact_search(vectors, queries, k):
+    """Single-process brute-force reference: [[(row, score)]] best first per query"""
+    vectors = _normalize(vectors)
+    queries = _normalize(np.atleast_2d(queries))
+    return _shard_top_k(vectors, None, 0, len(vectors), queries, k)
+
+
+def _layout(capacity, dimension):
+    """Views of the shared block: float32 vectors followed by one live flag per row"""
+    vectors_bytes = capacity * dimension * 4
+    return vectors_bytes, vectors_bytes + capacity
+
+
+def _init_worker(name, capacity, dimension):
+    """Map the shared matrix once per pool process; one BLAS thread per worker"""
+    global _worker_block, _worker_vectors, _worker_live
+    from threadpoolctl import threadpool_limits
+
+    threadpool_limits(1)
+    _worker_block = shared_memory.SharedMemory(name=name)
+    vectors_bytes, _ = _layout(capacity, dimension)
+    _worker_vectors = np.ndarray((capacity, dimension), dtype=np.float32, buffer=_worker_block.buf)
+    _worker_live = np.ndarray((capacity,), dtype=np.bool_, buffer=_worker_block.buf, offset=vectors_bytes)
+
+
+def _search_shard(start, stop, queries, k):
+    return _shard_top_k(_worker_vectors, _worker_live, start, stop, queries, k)
+
+
+class _ReadWriteLock:
+    """Many concurrent searches, or one update at a time"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+
+    @contextmanager
+    def reading(self):
+        with self._condition:
+            while self._writing:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._condition:
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class ShardedSearch:
+    """Exact top-k cosine search over a shared matrix, sharded across worker processes"""
+
+    def __init__(self, vectors, ids=None, workers=None, capacity=None):
+        vectors = _normalize(vectors)
+        size, self.dimension = vectors.shape
+        self.capacity = max(size, capacity or 0, 1)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self._lock = _ReadWriteLock()
+        self._refs_lock = threading.Lock()
+        self._refs = 0
+        self._retired = False
+
+        vectors_bytes, total_bytes = _layout(self.capacity, self.dimension)
+        self._block = shared_memory.SharedMemory(create=True, size=max(total_bytes, 1))
+        self._vectors = np.ndarray((self.capacity, self.dimension), dtype=np.float32, buffer=self._block.buf)
+        self._live = np.ndarray((self.capacity,), dtype=np.bool_, buffer=self._block.buf, offset=vectors_bytes)
+        self._vectors[:size] = vectors
+        self._live[:] = False
+        self._live[:size] = True
+
+        self._size = size
+        self._ids = np.zeros(self.capacity, dtype=np.int64)
+        self._ids[:size] = np.arange(size) if ids is None else np.asarray(ids)
+        self._row_of = {int(book_id): row for row, book_id in enumerate(self._ids[:size])}
+        # {id: text digest} of the embedded books, kept by the catalog functions to spot stale vectors
+        self.digests = {}
+
+        self._pool = None
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                # Forking a threaded server can copy locks held by other threads; start clean workers
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self._block.name, self.capacity, self.dimension),
+            )
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def __contains__(self, book_id):
+        return book_id in self._row_of
+
+    @property
+    def full(self):
+        return self._size >= self.capacity
+
+    def _shards(self):
+        bounds = np.linspace(0, self._size, min(self.workers, max(self._size, 1)) + 1).astype(int)
+        return [(int(start), int(stop)) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+    def search(self, queries, k):
+        """Return [[(id, score)]] best first for each query row"""
+        queries = _normalize(np.atleast_2d(queries))
+        with self._lock.reading():
+            k = min(k, len(self))
+            if k <= 0:
+                return [[] for _ in queries]
+            shards = self._shards()
+            if self._pool is None:
+                shard_results = [
+                    _shard_top_k(self._vectors, self._live, start, stop, queries, k) for start, stop in shards
+                ]
+            else:
+                futures = [self._pool.submit(_search_shard, start, stop, queries, k) for start, stop in shards]
+                shard_results = [future.result() for future in futures]
+            hits = _merge(shard_results, k)
+            return [[(self._ids[row].item(), score) for row, score in query_hits] for query_hits in hits]
+
+    def upsert(self, book_id, vector):
+        """Add or replace one book's vector in place; raises IndexError when the block is full"""
+        vector = _normalize(vector)
+        with self._lock.writing():
+            row = self._row_of.get(book_id)
+            if row is None:
+                if self.full:
+                    raise IndexError("Sharded search is at capacity")
+                row = self._size
+                self._size += 1
+                self._ids[row] = book_id
+                self._row_of[book_id] = row
+            self._vectors[row] = vector
+            self._live[row] = True
+
+    def remove(self, book_id):
+        """Mask a deleted book; its row is reclaimed on the next rebuild"""
+        with self._lock.writing():
+            row = self._row_of.pop(book_id, None)
+            if row is not None:
+                self._live[row] = False
+
+    def snapshot(self):
+        """Copy of the live (ids, vectors)"""
+        with self._lock.reading():
+            rows = np.flatnonzero(self._live[:self._size])
+            return self._ids[rows].copy(), self._vectors[rows].copy()
+
+    def retain(self):
+        with self._refs_lock:
+            self._refs += 1
+
+    def release(self):
+        with self._refs_lock:
+            self._refs -= 1
+            closing = self._retired and self._refs == 0
+        if closing:
+            self.close()
+
+    def retire(self):
+        """Close once the last retained user has released the search"""
+        with self._refs_lock:
+            self._retired = True
+            closing = self._refs == 0
+        if closing:
+            self.close()
+
+    def close(self):
+        """Wait for running searches, then stop the workers and free the shared block"""
+        with self._lock.writing():
+            self._close()
+
+    def _close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        if self._block is not None:
+            self._vectors = None
+            self._live = None
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_catalog_lock = threading.Lock()
+_load_lock = threading.Lock()
+_catalog = None
+_catalog_version = None
+_loop = None
+
+
+def _new_catalog(ids, vectors, digests):
+    # Leave room for books added between rebuilds
+    capacity = max(2 * len(ids), len(ids) + 1024)
+    catalog = ShardedSearch(vectors, ids, workers=int(settings.SEARCH_WORKERS), capacity=capacity)
+    catalog.digests = dict(digests)
+    return catalog
+
+
+def _replace_catalog(catalog, version):
+    global _catalog, _catalog_version
+    with _catalog_lock:
+        previous, _catalog, _catalog_version = _catalog, catalog, version
+    if previous is not None:
+        # Searches and updates still holding the previous catalog finish on it first
+        previous.retire()
+
+
+def catalog_enabled():
+    return _catalog is not None
+
+
+@contextmanager
+def _retained():
+    with _catalog_lock:
+        catalog = _catalog
+        if catalog is not None:
+            catalog.retain()
+    try:
+        yield catalog
+    finally:
+        if catalog is not None:
+            catalog.release()
+
+
+def _load_version(version):
+    with _load_lock:
+        if _catalog is None or version == _catalog_version:
+            return
+        current = embedding_index.load_current(settings.EMBEDDING_INDEX_DIR)
+        if current is None:
+            return
+        ids, vectors, _ = current
+        digests = embedding_index.load_digests(settings.EMBEDDING_INDEX_DIR, ids)
+        _replace_catalog(_new_catalog(ids, vectors, digests), version)
+    if _loop is not None:
+        # The new version can be older than the live catalog; reconcile on the event loop
+        asyncio.run_coroutine_threadsafe(sync_with_db(), _loop)
+
+
+def catalog_search():
+    """
+    Context manager holding the sharded search over the current catalog, or
+    None when disabled or not started. The catalog is not closed while held,
+    even if a new one replaces it. Only the `current` link is read per call; a
+    newly activated embedding index is loaded and then brought up to date
+    with the database. Blocks while loading, so call it off the event loop.
+    """
+    if _catalog is not None:
+        version = embedding_index.current_version(settings.EMBEDDING_INDEX_DIR)
+        if version is not None and version != _catalog_version:
+            _load_version(version)
+    return _retained()
+
+
+async def sync_with_db():
+    """Embed books added or edited since their vectors were computed and mask books no longer in the database"""
+    from app.services.recommendation_engine import encode_texts, stale_books
+
+    with _retained() as catalog:
+        if catalog is None:
+            return
+        ids, texts, deleted = await stale_books(catalog.digests)
+        await _remove_all(catalog, deleted)
+    if ids:
+        vectors = await asyncio.to_thread(encode_texts, texts)
+        await _upsert_all(ids, vectors, texts)
+
+
+async def _remove_all(catalog, book_ids):
+    def remove():
+        for book_id in book_ids:
+            catalog.remove(book_id)
+            catalog.digests.pop(book_id, None)
+
+    if book_ids:
+        # remove() waits for running searches; keep that off the event loop
+        await asyncio.to_thread(remove)
+
+
+async def _compact(catalog):
+    """Replace a full catalog by a copy of its live rows with double the capacity"""
+    global _catalog
+    live_ids, live_vectors = await asyncio.to_thread(catalog.snapshot)
+    compacted = await asyncio.to_thread(_new_catalog, live_ids, live_vectors, catalog.digests)
+    with _catalog_lock:
+        # A newly activated version may have replaced the catalog meanwhile
+        replaced = _catalog is catalog
+        if replaced:
+            _catalog = compacted
+    (catalog if replaced else compacted).retire()
+
+
+async def _upsert_all(ids, vectors, texts):
+    from app.services.recommendation_engine import text_digest
+
+    for book_id, vector, text in zip(ids, vectors, texts):
+        with _retained() as catalog:
+            if catalog is None:
+                return
+            if catalog.full:
+                await _compact(catalog)
+        with _retained() as catalog:
+            if catalog is not None:
+                await asyncio.to_thread(catalog.upsert, book_id, vector)
+                catalog.digests[book_id] = text_digest(text)
+
+
+async def apply_book_events(events):
+    """Event bus handler: re-embed changed books in one batch and update the shared matrix in place"""
+    from app.services.recommendation_engine import encode_texts, fetch_book_texts
+
+    if _catalog is None:
+        return
+    deleted = {event.id for event in events if event.op == DELETED}
+    changed = {event.id for event in events if event.op != DELETED} - deleted
+    with _retained() as catalog:
+        if catalog is not None:
+            await _remove_all(catalog, deleted)
+    if not changed:
+        return
+    ids, texts = await fetch_book_texts(changed)
+    if ids:
+        await _upsert_all(ids, await asyncio.to_thread(encode_texts, texts), texts)
+
+
+async def rebuild_from_db():
+    """Event bus rebuild: re-embed the whole catalog after missed events"""
+    from app.services.recommendation_engine import encode_texts, fetch_book_texts, text_digest
+
+    ids, texts = await fetch_book_texts()
+    vectors = await asyncio.to_thread(encode_texts, texts) if texts else None
+    if vectors is None:
+        dimension = await asyncio.to_thread(_embedding_dimension)
+        vectors = np.empty((0, dimension), dtype=np.float32)
+    digests = {book_id: text_digest(text) for book_id, text in zip(ids, texts)}
+    catalog = await asyncio.to_thread(_new_catalog, ids, vectors, digests)
+    _replace_catalog(catalog, embedding_index.current_version(settings.EMBEDDING_INDEX_DIR))
+
+
+def _embedding_dimension():
+    from app.services.recommendation_engine import get_embedding_model
+    return get_embedding_model().get_sentence_embedding_dimension()
+
+
+async def start_catalog_search():
+    """Load the catalog search from the active embedding index, or embed the catalog if there is none"""
+    global _loop
+    _loop = asyncio.get_running_loop()
+    version = embedding_index.current_version(settings.EMBEDDING_INDEX_DIR)
+    current = await asyncio.to_thread(embedding_index.load_current, settings.EMBEDDING_INDEX_DIR)
+    if current is None:
+        await rebuild_from_db()
+        return
+    ids, vectors, _ = current
+    digests = await asyncio.to_thread(embedding_index.load_digests, settings.EMBEDDING_INDEX_DIR, ids)
+    _replace_catalog(await asyncio.to_thread(_new_catalog, ids, vectors, digests), version)
+    await sync_with_db()
+
+
+def close_catalog_search():
+    global _loop
+    _replace_catalog(None, None)
+    _loop = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure sharded exact search against single-process brute force")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=16)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.rows, args.dim)).astype(np.float32)
+    queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    expected = exact_search(vectors, queries, args.k)
+    for workers in args.workers:
+        with ShardedSearch(vectors, workers=workers) as search:
+            search.search(queries, args.k)  # start the pool and fault the shared pages in
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = search.search(queries, args.k)
+                timings.append(time.perf_counter() - start)
+        status = "identical" if result == expected else "MISMATCH"
+        print(f"workers={workers:3d}  min {min(timings) * 1000:9.2f} ms  {status}")
+
+
+if __name__ == "__main__":
+    main()
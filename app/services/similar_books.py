@@ -0,0 +1,351 @@
+"""
+Module to precompute each book's nearest neighbours ("similar books").
+
+The graph is stored as two (N, k) arrays, neighbour ids and scores, next to a
+copy of the normalized catalog vectors. Building multiplies tiles of
+block_size rows by block_size columns and keeps a running top-k per row, so
+scoring memory is O(block_size^2) regardless of N. Adding, editing or
+removing a book touches only its own row and the rows that currently list it.
+Build the graph offline from the active embedding index with:
+
+    python -m app.services.similar_books --k 10
+"""
+import argparse
+import asyncio
+import os
+import threading
+import numpy as np
+from app.config import settings
+from app.events import DELETED
+from app.services import embedding_index
+from app.services.recommendation_engine import encode_texts, fetch_book_texts, stale_books, text_digest
+
+EMPTY_ID = -1
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores, k):
+    """Column indices and scores of the k best entries per row, best first; padded with -1/-inf"""
+    rows, columns = scores.shape
+    indices = np.full((rows, k), EMPTY_ID, dtype=np.int64)
+    values = np.full((rows, k), -np.inf, dtype=np.float32)
+    take = min(k, columns)
+    if take == 0:
+        return indices, values
+    part = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    indices[:, :take] = np.take_along_axis(part, order, axis=1)
+    values[:, :take] = np.take_along_axis(part_scores, order, axis=1)
+    # Fewer real candidates than k (tiny catalogs): drop the masked self-matches
+    indices[~np.isfinite(values)] = EMPTY_ID
+    return indices, values
+
+
+class SimilarBooksIndex:
+    """Top-k similar books per book, kept up to date incrementally"""
+
+    def __init__(self, k=None, block_size=1024):
+        self.k = k or settings.SIMILAR_BOOKS_K
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._reset(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+
+    def _reset(self, ids, vectors):
+        self._size = len(ids)
+        self._ids = np.array(ids, dtype=np.int64)
+        self._vectors = _normalize(vectors) if len(ids) else np.asarray(vectors, dtype=np.float32)
+        self._row_of = {int(book_id): row for row, book_id in enumerate(self._ids)}
+        self._neighbor_ids = np.full((self._size, self.k), EMPTY_ID, dtype=np.int64)
+        self._neighbor_scores = np.full((self._size, self.k), -np.inf, dtype=np.float32)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, book_id):
+        return book_id in self._row_of
+
+    def _score_rows(self, rows):
+        """
+        Recompute the neighbour lists of `rows` against the whole catalog.
+        Rows and columns are both tiled, and a running top-k is kept per row,
+        so no step holds more than block_size x (block_size + k) scores.
+        """
+        size = self._size
+        vectors = self._vectors[:size]
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            best_columns = np.empty((len(block), 0), dtype=np.int64)
+            best_scores = np.empty((len(block), 0), dtype=np.float32)
+            for column in range(0, size, self.block_size):
+                tile = vectors[column:column + self.block_size]
+                scores = vectors[block] @ tile.T
+                local = block - column
+                own = (local >= 0) & (local < len(tile))
+                scores[np.nonzero(own)[0], local[own]] = -np.inf
+                columns = np.broadcast_to(np.arange(column, column + len(tile)), scores.shape)
+                picked, best_scores = _top_k(np.concatenate([best_scores, scores], axis=1), self.k)
+                merged_columns = np.concatenate([best_columns, columns], axis=1)
+                best_columns = np.where(
+                    picked != EMPTY_ID, np.take_along_axis(merged_columns, np.maximum(picked, 0), axis=1), EMPTY_ID
+                )
+            found = best_columns != EMPTY_ID
+            self._neighbor_ids[block] = np.where(found, self._ids[:size][np.maximum(best_columns, 0)], EMPTY_ID)
+            self._neighbor_scores[block] = best_scores
+
+    def build(self, ids, vectors):
+        """Rebuild the whole graph from catalog vectors"""
+        with self._lock:
+            self._reset(ids, vectors)
+            self._score_rows(np.arange(self._size))
+
+    def adopt(self, other):
+        """Serve another index's graph from now on, e.g. one loaded for a new embedding index version"""
+        with self._lock:
+            self.k, self.block_size = other.k, other.block_size
+            self._size, self._ids, self._vectors, self._row_of = other._size, other._ids, other._vectors, other._row_of
+            self._neighbor_ids, self._neighbor_scores = other._neighbor_ids, other._neighbor_scores
+
+    def similar(self, book_id):
+        """Return [(book_id, score)] best first; constant time"""
+        row = self._row_of.get(book_id)
+        if row is None:
+            return None
+        ids = self._neighbor_ids[row]
+        scores = self._neighbor_scores[row]
+        return [(int(i), float(s)) for i, s in zip(ids, scores) if i != EMPTY_ID]
+
+    def _grow(self, dimension):
+        capacity = len(self._ids)
+        if self._size < capacity:
+            return
+        capacity = max(16, capacity * 2)
+        if self._size == 0:
+            # Nothing to carry over, and an empty catalog's vectors have no dimension yet
+            self._ids = np.empty(capacity, dtype=np.int64)
+            self._vectors = np.zeros((capacity, dimension), dtype=np.float32)
+            self._neighbor_ids = np.full((capacity, self.k), EMPTY_ID, dtype=np.int64)
+            self._neighbor_scores = np.full((capacity, self.k), -np.inf, dtype=np.float32)
+            return
+        vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+        self._ids = np.resize(self._ids, capacity)
+        self._neighbor_ids = np.resize(self._neighbor_ids, (capacity, self.k))
+        self._neighbor_scores = np.resize(self._neighbor_scores, (capacity, self.k))
+
+    def _rows_listing(self, book_id):
+        return np.nonzero((self._neighbor_ids[:self._size] == book_id).any(axis=1))[0]
+
+    def upsert(self, book_id, vector):
+        """Add or replace one book's vector and patch the affected neighbour lists"""
+        vector = _normalize(vector)
+        with self._lock:
+            row = self._row_of.get(book_id)
+            if row is None:
+                self._grow(vector.shape[0])
+                row = self._size
+                self._size += 1
+                self._ids[row] = book_id
+                self._row_of[book_id] = row
+            self._vectors[row] = vector
+            size = self._size
+
+            # Rows that list this book hold a stale score and may now rank it lower
+            stale = self._rows_listing(book_id)
+            self._score_rows(np.union1d(stale, [row]).astype(np.int64))
+
+            # Everyone else only gains it if it beats their current worst neighbour
+            scores = self._vectors[:size] @ vector
+            scores[row] = -np.inf
+            scores[stale] = -np.inf
+            candidates = np.nonzero(scores > self._neighbor_scores[:size, -1])[0]
+            for candidate in candidates:
+                position = np.searchsorted(-self._neighbor_scores[candidate], -scores[candidate], side="right")
+                self._neighbor_ids[candidate, position + 1:] = self._neighbor_ids[candidate, position:-1]
+                self._neighbor_scores[candidate, position + 1:] = self._neighbor_scores[candidate, position:-1]
+                self._neighbor_ids[candidate, position] = book_id
+                self._neighbor_scores[candidate, position] = scores[candidate]
+
+    def remove(self, book_id):
+        """Drop a book and refill the rows that listed it"""
+        with self._lock:
+            row = self._row_of.pop(book_id, None)
+            if row is None:
+                return
+            last = self._size - 1
+            if row != last:
+                moved = int(self._ids[last])
+                self._ids[row] = moved
+                self._vectors[row] = self._vectors[last]
+                self._neighbor_ids[row] = self._neighbor_ids[last]
+                self._neighbor_scores[row] = self._neighbor_scores[last]
+                self._row_of[moved] = row
+            self._size = last
+            stale = self._rows_listing(book_id)
+            if len(stale):
+                self._score_rows(stale)
+
+    def save(self, path):
+        with self._lock:
+            size = self._size
+            np.savez(
+                path,
+                ids=self._ids[:size],
+                neighbor_ids=self._neighbor_ids[:size],
+                neighbor_scores=self._neighbor_scores[:size],
+            )
+
+    def load(self, path, ids, vectors):
+        """Load a saved graph for the catalog `ids`/`vectors`; returns False if it does not match"""
+        with np.load(path) as data:
+            if data["neighbor_ids"].shape[1] != self.k or not np.array_equal(data["ids"], ids):
+                return False
+            with self._lock:
+                self._reset(ids, vectors)
+                self._neighbor_ids[:] = data["neighbor_ids"]
+                self._neighbor_scores[:] = data["neighbor_scores"]
+        return True
+
+
+def graph_path(index_dir, k):
+    return os.path.join(index_dir, embedding_index.CURRENT, f"similar-k{k}.npz")
+
+
+def load_or_build(index, index_dir):
+    """Load the precomputed graph for the active embedding index, building it if missing"""
+    current = embedding_index.load_current(index_dir)
+    if current is None:
+        return False
+    ids, vectors, _ = current
+    path = graph_path(index_dir, index.k)
+    if os.path.exists(path) and index.load(path, ids, vectors):
+        return True
+    index.build(ids, vectors)
+    return True
+
+
+async def apply_book_events(events):
+    """Event bus handler: re-embed changed books in one batch and patch the graph"""
+    deleted = {event.id for event in events if event.op == DELETED}
+    changed = {event.id for event in events if event.op != DELETED} - deleted
+    await _remove_all(deleted)
+    if not changed:
+        return
+    ids, texts = await fetch_book_texts(changed)
+    await _upsert_all(ids, texts)
+
+
+async def _remove_all(book_ids):
+    for book_id in book_ids:
+        await asyncio.to_thread(similar_books_index.remove, book_id)
+        _digests.pop(book_id, None)
+
+
+async def _upsert_all(ids, texts):
+    if not ids:
+        return
+    vectors = await asyncio.to_thread(encode_texts, texts)
+    for book_id, text, vector in zip(ids, texts, vectors):
+        await asyncio.to_thread(similar_books_index.upsert, book_id, vector)
+        _digests[book_id] = text_digest(text)
+
+
+async def sync_with_db():
+    """Embed books added or edited since the graph's vectors were computed, and drop deleted books"""
+    ids, texts, deleted = await stale_books(_digests)
+    await _remove_all(deleted)
+    await _upsert_all(ids, texts)
+
+
+async def rebuild_from_db():
+    """Event bus rebuild: re-embed the whole catalog after missed events"""
+    global _digests, _graph_version
+    ids, texts = await fetch_book_texts()
+    vectors = await asyncio.to_thread(encode_texts, texts) if texts else np.empty((0, 0), dtype=np.float32)
+    await asyncio.to_thread(similar_books_index.build, ids, vectors)
+    _digests = {book_id: text_digest(text) for book_id, text in zip(ids, texts)}
+    # Fresher than any index version activated so far
+    _graph_version = embedding_index.current_version(settings.EMBEDDING_INDEX_DIR)
+
+
+def _load_current_version(index_dir):
+    """(version, graph, digests) for the active embedding index, or None if there is none"""
+    version = embedding_index.current_version(index_dir)
+    graph = SimilarBooksIndex(k=similar_books_index.k, block_size=similar_books_index.block_size)
+    if not load_or_build(graph, index_dir):
+        return None
+    return version, graph, embedding_index.load_digests(index_dir, graph._ids[:len(graph)])
+
+
+async def load_current_version():
+    """Serve the graph of the active embedding index, brought up to date with the database"""
+    global _digests, _graph_version
+    loaded = await asyncio.to_thread(_load_current_version, settings.EMBEDDING_INDEX_DIR)
+    if loaded is None:
+        return False
+    _graph_version, graph, _digests = loaded
+    similar_books_index.adopt(graph)
+    await sync_with_db()
+    return True
+
+
+async def start_similar_books():
+    """Load the graph for the active embedding index, or embed the catalog if there is none (fresh deployment)"""
+    if not await load_current_version():
+        await rebuild_from_db()
+
+
+def follow_current_version():
+    """
+    Called per request: only the `current` link is read. A newly activated
+    embedding index is loaded in the background while the old graph keeps serving.
+    """
+    global _reload
+    version = embedding_index.current_version(settings.EMBEDDING_INDEX_DIR)
+    if version is None or version == _graph_version or (_reload is not None and not _reload.done()):
+        return
+    _reload = asyncio.get_running_loop().create_task(_reload_current_version())
+
+
+async def _reload_current_version():
+    try:
+        await load_current_version()
+    except Exception as e:
+        # Keep serving the old graph; the next request retries
+        print(f"Loading similar books for the new embedding index failed: {e}")
+
+
+# {id: text digest} of the vectors the graph was computed from
+_digests = {}
+_graph_version = None
+_reload = None
+similar_books_index = SimilarBooksIndex()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the similar-books graph from the active embedding index")
+    parser.add_argument("--index-dir", default=settings.EMBEDDING_INDEX_DIR)
+    parser.add_argument("--k", type=int, default=settings.SIMILAR_BOOKS_K)
+    parser.add_argument("--block-size", type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    current = embedding_index.load_current(args.index_dir)
+    if current is None:
+        raise SystemExit(f"No active embedding index in {args.index_dir}; run app.services.reembed_job first")
+    ids, vectors, manifest = current
+    index = SimilarBooksIndex(k=args.k, block_size=args.block_size)
+    index.build(ids, vectors)
+    path = graph_path(args.index_dir, args.k)
+    index.save(path)
+    print(f"Saved top-{args.k} neighbours for {len(index)} books ({manifest['version']}) to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Module to coalesce identical in-flight computations"""
+import asyncio
+import hashlib
+import json
+
+
+def request_key(namespace, payload):
+    """Canonical hash of a request: identical payloads map to the same key regardless of dict order"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return f"{namespace}:{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+
+class _Call:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Run at most one computation per key at a time. Callers arriving while a
+    computation for their key is in flight await the same result instead of
+    starting their own.
+
+    The computation runs in its own task, so a caller that is cancelled (for
+    example because its client disconnected) only stops waiting. The
+    computation itself is cancelled once no caller is left waiting for it.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def in_flight(self, key):
+        return key in self._calls
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key, fn):
+        """Return the result of `await fn()`, sharing it with concurrent callers of the same key"""
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda _task: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller is gone; later callers must start a fresh computation
+                self._forget(key, call)
+                call.task.cancel()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,53 @@
+"""Store benchmark results and compare them against a stored baseline"""
+import json
+import math
+
+
+def save_results(results, path):
+    with open(path, "w") as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def compare(results, baseline, tolerance=0.10):
+    """
+    Compare two {name: {metric: value}} mappings. Metrics ending in "_s" are
+    latencies (lower is better); "rps" is throughput (higher is better).
+    Returns a list of human-readable regressions.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, value in metrics.items():
+            old = previous.get(metric)
+            if not old:
+                continue
+            if metric.endswith("_s") and value > old * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {old:.6f}s -> {value:.6f}s (+{(value / old - 1) * 100:.1f}%)")
+            elif metric == "rps" and value < old * (1 - tolerance):
+                regressions.append(f"{name}.{metric}: {old:.1f} -> {value:.1f} ({(value / old - 1) * 100:.1f}%)")
+    return regressions
+
+
+def report_comparison(results, baseline_path, tolerance):
+    """Print regressions against the baseline file and return a process exit code"""
+    regressions = compare(results, load_results(baseline_path), tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print(f"No regressions beyond {tolerance * 100:.0f}% against {baseline_path}")
+    return 1 if regressions else 0
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
@@ -0,0 +1,58 @@
+"""Local fake of the Ollama chat API for offline benchmarks and tests"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/chat with a deterministic summary after a configurable delay"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/api/chat":
+            self.send_error(404)
+            return
+        request = json.loads(body or b"{}")
+        content = request["messages"][-1]["content"]
+        time.sleep(self.server.latency)
+        self.server.calls.append({"model": request.get("model"), "options": request.get("options"), "chars": len(content)})
+        payload = json.dumps({
+            "model": request.get("model"),
+            "created_at": "1970-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": f"Summary of {len(content)} characters: {content[:40]}"},
+            "done": True,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_ollama(host="127.0.0.1", port=0, latency=0.0):
+    """Start the fake server in a daemon thread and return it; `server.url` is its base URL"""
+    server = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+    server.latency = latency
+    server.calls = []
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per chat call")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), FakeOllamaHandler)
+    server.latency = args.latency
+    server.calls = []
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}")
+    server.serve_forever()
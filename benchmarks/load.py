@@ -0,0 +1,187 @@
+"""
+End-to-end load generator for /books, /reviews, /recommendations and /summaries.
+
+Against a running server (see benchmarks.serve for one wired to local fakes):
+
+    python -m benchmarks.load --base-url http://127.0.0.1:8000 --duration 30 --concurrency 32
+
+Or fully in-process with the fake Ollama server and the stub embedding model
+(still needs DATABASE_URL pointing at a disposable PostgreSQL database):
+
+    python -m benchmarks.load --in-process --output load.json
+    python -m benchmarks.load --in-process --baseline load.json
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import time
+import uuid
+from collections import defaultdict
+import httpx
+from benchmarks.baseline import percentile, save_results, report_comparison
+from benchmarks.stubs import make_books, make_book_text
+
+QUERIES = ["science fiction about robots", "a mystery in a winter city", "fantasy with dragons and kings"]
+
+
+async def authenticate(client):
+    """Create a throwaway user and return auth headers"""
+    username = f"bench-{uuid.uuid4().hex[:12]}"
+    credentials = {"username": username, "password": "bench-password"}
+    response = await client.post("/auth/sign-up", json={**credentials, "email": f"{username}@example.com"})
+    response.raise_for_status()
+    response = await client.post("/auth/login", json=credentials)
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def seed_books(client, headers, count):
+    book_ids = []
+    for book in make_books(count, seed=42):
+        payload = {
+            "title": book.title,
+            "author": book.author,
+            "genre": book.genre,
+            "year_published": book.year_published,
+            "summary": book.summary,
+        }
+        response = await client.post("/books/", json=payload, headers=headers)
+        response.raise_for_status()
+        book_ids.append(response.json()["id"])
+    return book_ids
+
+
+def build_requests(book_ids, summary_chars):
+    """Weighted round-robin of (endpoint label, request kwargs) pairs"""
+    summary_text = make_book_text(summary_chars)
+    mix = []
+    for i, book_id in enumerate(book_ids):
+        mix.append(("GET /books/", {"method": "GET", "url": "/books/"}))
+        mix.append(("GET /books/{book_id}", {"method": "GET", "url": f"/books/{book_id}"}))
+        mix.append(("POST /reviews/{book_id}", {"method": "POST", "url": f"/reviews/{book_id}", "json": {"rating": i % 5 + 1, "review_text": "bench"}}))
+        mix.append(("GET /reviews/{book_id}", {"method": "GET", "url": f"/reviews/{book_id}"}))
+        mix.append(("GET /recommendations/", {"method": "GET", "url": "/recommendations/", "json": {"content": QUERIES[i % len(QUERIES)]}}))
+        mix.append(("POST /summaries/generate-summary", {"method": "POST", "url": "/summaries/generate-summary", "json": {"content": summary_text}}))
+    return mix
+
+
+async def worker(client, headers, requests, deadline, samples, errors):
+    for label, kwargs in requests:
+        if time.perf_counter() >= deadline:
+            return
+        start = time.perf_counter()
+        try:
+            response = await client.request(headers=headers, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        samples[label].append(time.perf_counter() - start)
+        if not ok:
+            errors[label] += 1
+
+
+def summarize(samples, errors, elapsed):
+    results = {}
+    everything = []
+    for label, latencies in sorted(samples.items()):
+        latencies.sort()
+        everything.extend(latencies)
+        results[label] = {
+            "count": len(latencies),
+            "errors": errors[label],
+            "rps": len(latencies) / elapsed,
+            "p50_s": percentile(latencies, 0.50),
+            "p95_s": percentile(latencies, 0.95),
+            "p99_s": percentile(latencies, 0.99),
+        }
+    everything.sort()
+    results["all"] = {
+        "count": len(everything),
+        "errors": sum(errors.values()),
+        "rps": len(everything) / elapsed,
+        "p50_s": percentile(everything, 0.50),
+        "p95_s": percentile(everything, 0.95),
+        "p99_s": percentile(everything, 0.99),
+    }
+    return results
+
+
+async def run_load(client, duration, concurrency, seed_count, summary_chars):
+    headers = await authenticate(client)
+    book_ids = await seed_books(client, headers, seed_count)
+    mix = build_requests(book_ids, summary_chars)
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    start = time.perf_counter()
+    deadline = start + duration
+    # Each worker starts at a different offset so endpoints are hit concurrently
+    workers = [
+        worker(client, headers, itertools.islice(itertools.cycle(mix), offset, None), deadline, samples, errors)
+        for offset in range(concurrency)
+    ]
+    await asyncio.gather(*workers)
+    return summarize(samples, errors, time.perf_counter() - start)
+
+
+async def run_in_process(args):
+    from benchmarks.fake_ollama import start_fake_ollama
+
+    fake_ollama = start_fake_ollama(latency=args.ollama_latency)
+    # The ollama client reads OLLAMA_HOST when it is first imported
+    os.environ["OLLAMA_HOST"] = fake_ollama.url
+    from app.main import app, startup
+    from app.services.recommendation_engine import set_embedding_model
+    from benchmarks.stubs import StubEmbeddingModel
+
+    set_embedding_model(StubEmbeddingModel())
+    await startup()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            return await run_load(client, args.duration, args.concurrency, args.seed_books, args.summary_chars)
+    finally:
+        fake_ollama.shutdown()
+
+
+async def run_remote(args):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=None) as client:
+        return await run_load(client, args.duration, args.concurrency, args.seed_books, args.summary_chars)
+
+
+def print_report(results):
+    print(f"{'endpoint':36s} {'count':>7s} {'err':>5s} {'rps':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for label, row in results.items():
+        print(
+            f"{label:36s} {row['count']:7d} {row['errors']:5d} {row['rps']:9.1f} "
+            f"{row['p50_s'] * 1000:9.2f} {row['p95_s'] * 1000:9.2f} {row['p99_s'] * 1000:9.2f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive the API concurrently and report latency percentiles")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--base-url", help="URL of a running server")
+    target.add_argument("--in-process", action="store_true", help="run the app in-process against local fakes")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed-books", type=int, default=50)
+    parser.add_argument("--summary-chars", type=int, default=8000)
+    parser.add_argument("--ollama-latency", type=float, default=0.05, help="fake Ollama seconds per call")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a stored results file")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_in_process(args) if args.in_process else run_remote(args))
+    print_report(results)
+    if args.output:
+        save_results(results, args.output)
+    if args.baseline:
+        return report_comparison(results, args.baseline, args.tolerance)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+"""
+Microbenchmarks for the recommendation, chunking and serialization hot paths.
+
+    python -m benchmarks.micro --sizes 1000 10000 100000 --output bench.json
+    python -m benchmarks.micro --baseline bench.json
+"""
+import argparse
+import json
+import statistics
+import time
+from fastapi.encoders import jsonable_encoder
+from app.config import settings
+from app.schemas import BookResponse, BookRow
+from app.serialization import book_rows_adapter, rows_response
+from app.services import recommendation_engine
+from app.services.llama_service import llama_service
+from benchmarks.baseline import save_results, report_comparison
+from benchmarks.stubs import StubEmbeddingModel, make_books, make_book_text
+
+QUERY = "a detective story about a secret letter in a winter city"
+
+
+def measure(fn, repeat):
+    """Run `fn` `repeat` times and return min/median wall time in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {"min_s": min(timings), "median_s": statistics.median(timings)}
+
+
+def serialize_book_responses(books):
+    """Serialize the way FastAPI does for response_model=List[BookResponse]"""
+    validated = [BookResponse.model_validate(book, from_attributes=True) for book in books]
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def serialize_book_rows(rows):
+    """Serialize plain rows through the orjson fast path used by get_books"""
+    return rows_response(rows, book_rows_adapter).body
+
+
+def run(sizes, repeat):
+    recommendation_engine.set_embedding_model(StubEmbeddingModel())
+    chunk_size = settings.CHUNK_SIZE or 2000
+    results = {}
+    for size in sizes:
+        books = make_books(size)
+        embeddings = recommendation_engine.create_book_embeddings(books)
+        book_text = make_book_text(size * 100)
+        rows = [{name: getattr(book, name) for name in BookRow.__annotations__} for book in books]
+        benches = {
+            "create_book_embeddings": lambda: recommendation_engine.create_book_embeddings(books),
+            "process_user_query": lambda: recommendation_engine.process_user_query(QUERY, embeddings, books),
+            "chunk_text": lambda: llama_service.chunk_text(book_text, chunk_size=chunk_size),
+            "serialize_book_responses": lambda: serialize_book_responses(books),
+            "serialize_book_rows": lambda: serialize_book_rows(rows),
+        }
+        for name, fn in benches.items():
+            key = f"{name}[{size}]"
+            results[key] = measure(fn, repeat)
+            print(f"{key:40s} median {results[key]['median_s'] * 1000:10.3f} ms  min {results[key]['min_s'] * 1000:10.3f} ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run microbenchmarks with a stub embedding model")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a stored results file")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat)
+    if args.output:
+        save_results(results, args.output)
+    if args.baseline:
+        return report_comparison(results, args.baseline, args.tolerance)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
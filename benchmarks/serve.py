@@ -0,0 +1,30 @@
+"""
+Run the API under uvicorn with a fake Ollama server and the stub embedding model.
+
+    python -m benchmarks.serve --port 8000
+"""
+import argparse
+import os
+import uvicorn
+from benchmarks.fake_ollama import start_fake_ollama
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--ollama-latency", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    fake_ollama = start_fake_ollama(latency=args.ollama_latency)
+    os.environ["OLLAMA_HOST"] = fake_ollama.url
+    from app.main import app
+    from app.services.recommendation_engine import set_embedding_model
+    from benchmarks.stubs import StubEmbeddingModel
+
+    set_embedding_model(StubEmbeddingModel())
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Deterministic local stand-ins for the embedding model and the catalog"""
+import zlib
+import numpy as np
+from app.models import Book
+
+GENRES = ["Fiction", "Fantasy", "Mystery", "Science Fiction", "History", "Romance", "Biography"]
+WORDS = (
+    "dragon ship detective murder love war empire star planet robot king queen "
+    "journey river city winter secret letter garden island ocean mountain"
+).split()
+
+
+class StubEmbeddingModel:
+    """
+    Feature-hashing encoder with the same `encode` signature as SentenceTransformer.
+    Identical text always maps to the identical unit vector, so results are reproducible.
+    """
+
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, sentences, convert_to_tensor=False, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        vectors = np.zeros((len(sentences), self.dimension), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            for word in sentence.lower().split():
+                vectors[row, zlib.crc32(word.encode()) % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+def make_books(count, seed=0):
+    """Build `count` transient Book rows with reproducible content"""
+    rng = np.random.default_rng(seed)
+    books = []
+    for i in range(count):
+        words = rng.choice(WORDS, size=12)
+        books.append(Book(
+            id=i + 1,
+            title=f"The {words[0].title()} of {words[1].title()} {i}",
+            author=f"Author {i % 997}",
+            genre=GENRES[i % len(GENRES)],
+            year_published=1900 + i % 125,
+            summary=" ".join(words),
+        ))
+    return books
+
+
+def make_book_text(length, seed=0):
+    """Build a reproducible book body of roughly `length` characters"""
+    rng = np.random.default_rng(seed)
+    words = rng.choice(WORDS, size=length // 6 + 1)
+    return " ".join(words)[:length]
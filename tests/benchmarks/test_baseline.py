@@ -0,0 +1,87 @@
+import json
+from benchmarks import micro
+from benchmarks.baseline import compare, percentile, report_comparison, save_results
+from benchmarks.load import summarize
+
+BASELINE = {
+    "GET /books/": {"count": 100, "errors": 0, "rps": 200.0, "p50_s": 0.010, "p99_s": 0.050},
+    "chunk_text[1000]": {"min_s": 0.002, "median_s": 0.003},
+}
+
+def test_latency_increase_beyond_tolerance_is_a_regression():
+    results = {"GET /books/": {**BASELINE["GET /books/"], "p99_s": 0.056}}
+
+    regressions = compare(results, BASELINE, tolerance=0.10)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("GET /books/.p99_s: 0.050000s -> 0.056000s")
+
+def test_throughput_drop_beyond_tolerance_is_a_regression():
+    results = {"GET /books/": {**BASELINE["GET /books/"], "rps": 170.0}}
+
+    assert compare(results, BASELINE, tolerance=0.10) == ["GET /books/.rps: 200.0 -> 170.0 (-15.0%)"]
+
+def test_changes_within_tolerance_and_improvements_pass():
+    results = {
+        "GET /books/": {"count": 5, "errors": 3, "rps": 185.0, "p50_s": 0.005, "p99_s": 0.054},
+        "chunk_text[1000]": {"min_s": 0.0021, "median_s": 0.001},
+    }
+
+    # count and errors are not compared; faster latencies and higher throughput never regress
+    assert compare(results, BASELINE, tolerance=0.10) == []
+
+def test_entries_and_metrics_missing_from_the_baseline_are_skipped():
+    results = {
+        "GET /reviews/{book_id}": {"p50_s": 10.0},
+        "chunk_text[1000]": {"median_s": 0.003, "max_s": 10.0},
+    }
+
+    assert compare(results, {**BASELINE, "chunk_text[1000]": {"median_s": 0.003, "max_s": 0.0}}) == []
+    assert compare(results, BASELINE) == []
+
+def test_percentile_is_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+
+    assert percentile([], 0.5) == 0.0
+    assert percentile([7.0], 0.99) == 7.0
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.95) == 95.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile(values, 1.0) == 100.0
+    assert percentile([1.0, 2.0, 3.0], 0.0) == 1.0
+
+def test_report_comparison_exit_code(tmp_path, capsys):
+    path = tmp_path / "baseline.json"
+    save_results(BASELINE, str(path))
+    assert json.loads(path.read_text()) == BASELINE
+
+    assert report_comparison(BASELINE, str(path), 0.10) == 0
+    assert "No regressions beyond 10%" in capsys.readouterr().out
+
+    slower = {"chunk_text[1000]": {"min_s": 0.004, "median_s": 0.003}}
+    assert report_comparison(slower, str(path), 0.10) == 1
+    assert "REGRESSION chunk_text[1000].min_s" in capsys.readouterr().out
+
+def test_micro_runner_exits_non_zero_on_regression(tmp_path):
+    baseline = tmp_path / "micro.json"
+    assert micro.main(["--sizes", "20", "--repeat", "1", "--output", str(baseline)]) == 0
+    results = json.loads(baseline.read_text())
+    assert set(results) == {
+        f"{name}[20]" for name in
+        ("create_book_embeddings", "process_user_query", "chunk_text", "serialize_book_responses", "serialize_book_rows")
+    }
+
+    # Against a baseline a thousand times faster, every benchmark regresses
+    faster = {name: {metric: value / 1000 for metric, value in row.items()} for name, row in results.items()}
+    save_results(faster, str(baseline))
+    assert micro.main(["--sizes", "20", "--repeat", "1", "--baseline", str(baseline)]) == 1
+
+def test_load_summary_reports_percentiles_per_endpoint_and_overall():
+    samples = {"GET /books/": [0.3, 0.1, 0.2], "GET /books/{book_id}": [0.4]}
+    results = summarize(samples, {"GET /books/": 1, "GET /books/{book_id}": 0}, elapsed=2.0)
+
+    assert results["GET /books/"] == {"count": 3, "errors": 1, "rps": 1.5, "p50_s": 0.2, "p95_s": 0.3, "p99_s": 0.3}
+    assert results["all"]["count"] == 4
+    assert results["all"]["errors"] == 1
+    assert results["all"]["p50_s"] == 0.2
+    assert results["all"]["p99_s"] == 0.4
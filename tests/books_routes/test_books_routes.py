@@ -2,7 +2,7 @@ import pytest
 from fastapi import FastAPI
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from app.models import Book, Review
 from app.schemas import BookCreate
 from app.database import get_db
@@ -60,13 +60,13 @@ async def test_create_book_success(async_client, mock_db):
 # GET BOOKS TESTS
 @pytest.mark.asyncio
 async def test_get_books_success(async_client, mock_db):
-    # Setup mock books
-    mock_books = [
-        Book(id=1, **test_book),
-        Book(id=2, title="Book 2", author="Author 2", summary="Summary 2")
+    # Setup mock book rows
+    mock_rows = [
+        {"id": 1, "genre": "Fiction", "year_published": 2020, **test_book},
+        {"id": 2, "title": "Book 2", "author": "Author 2", "genre": "Fiction", "year_published": 2021, "summary": "Summary 2"}
     ]
-    mock_result = AsyncMock()
-    mock_result.scalars.return_value.all.return_value = mock_books
+    mock_result = Mock()
+    mock_result.mappings.return_value.all.return_value = mock_rows
     mock_db.execute.return_value = mock_result
 
     response = await async_client.get("/")
@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+from app.models import Base, Book, Review
+from app.db_instrumentation import instrument_engine, query_budget, track_queries
+
+@pytest.fixture
+def engine():
+    engine = instrument_engine(create_engine("sqlite://"))
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+def test_track_queries_counts_statements(engine):
+    with Session(engine) as session, track_queries(capture=True) as stats:
+        session.execute(select(Book)).scalars().all()
+        session.execute(select(Review).filter(Review.book_id == 1)).scalars().all()
+
+    assert stats.count == 2
+    assert stats.duration > 0
+    assert "reviews.book_id" in stats.statements[1]
+
+def test_query_budget_exceeded(engine):
+    with pytest.raises(AssertionError) as exc_info:
+        with Session(engine) as session, query_budget(1):
+            for book_id in range(3):
+                session.execute(select(Review).filter(Review.book_id == book_id)).scalars().all()
+
+    assert "got 3" in str(exc_info.value)
+
+def test_query_budget_within_limit(engine):
+    with Session(engine) as session, query_budget(1) as stats:
+        session.execute(select(Book)).scalars().all()
+
+    assert stats.count == 1
+
+def test_review_foreign_keys_are_indexed(engine):
+    indexed = {tuple(index["column_names"]) for index in inspect(engine).get_indexes("reviews")}
+
+    assert ("book_id",) in indexed
+    assert ("user_id",) in indexed
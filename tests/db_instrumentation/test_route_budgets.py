@@ -0,0 +1,101 @@
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from app.api import books, reviews
+from app.auth import get_current_user
+from app.database import get_db
+from app.db_instrumentation import (
+    QueryStatsMiddleware, assert_route_budget, find_sequential_scans, instrument_engine, track_queries, _seq_scans,
+)
+from sqlalchemy.future import select
+from app.models import Book
+from tests.sqlite_session import SyncBackedSession, sqlite_engine
+
+@pytest.fixture
+def engine():
+    engine = sqlite_engine(instrument_engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def client(engine):
+    app = FastAPI()
+    app.add_middleware(QueryStatsMiddleware)
+    app.include_router(books.router, prefix="/books")
+    app.include_router(reviews.router, prefix="/reviews")
+
+    async def get_test_db():
+        with Session(engine, expire_on_commit=False) as session:
+            yield SyncBackedSession(session)
+
+    app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_current_user] = lambda: 1
+    with TestClient(app) as client:
+        yield client
+
+def test_routes_stay_within_query_budgets(client, engine):
+    book = {"title": "Dune", "author": "Frank Herbert", "genre": "Science Fiction", "year_published": 1965, "summary": "Spice"}
+    created = client.post("/books/", json=book)
+    assert created.status_code == 200
+    book_id = created.json()["id"]
+
+    with track_queries(capture=True) as stats:
+        responses = [
+            created,
+            client.get("/books/"),
+            client.get(f"/books/{book_id}"),
+            client.put(f"/books/{book_id}", json={"summary": "Desert planet"}),
+            client.post(f"/reviews/{book_id}", json={"rating": 5, "review_text": "Great"}),
+            client.get(f"/reviews/{book_id}"),
+            client.get(f"/books/{book_id}/summary"),
+            client.delete(f"/books/{book_id}"),
+        ]
+    for response in responses:
+        assert response.status_code == 200, response.text
+        assert "x-route" not in response.headers
+        assert_route_budget(response)
+    assert stats.count == sum(int(response.headers["X-DB-Query-Count"]) for response in responses[1:])
+
+    # EXPLAIN exactly what the routes ran: every filtered statement must use an index
+    with engine.connect() as conn:
+        assert find_sequential_scans(conn, stats, min_rows=0) == []
+
+def test_failed_statement_leaves_stats_consistent(engine):
+    with engine.connect() as conn, track_queries() as stats:
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql("SELECT * FROM missing_table")
+        assert stats.count == 0
+        assert stats.duration == 0
+        time.sleep(0.05)
+        conn.exec_driver_sql("SELECT 1")
+
+    # The next statement is timed from its own start, not from the failed one
+    assert stats.count == 1
+    assert 0 < stats.duration < 0.05
+
+def test_unindexed_filter_is_reported(engine):
+    with engine.connect() as conn:
+        with track_queries(capture=True) as stats:
+            conn.execute(select(Book.id).where(Book.author == "Frank Herbert")).all()
+            conn.execute(select(Book.id).where(Book.id == 1)).all()
+        findings = find_sequential_scans(conn, stats, min_rows=0)
+
+    assert [(finding["table"], "author" in finding["filter"]) for finding in findings] == [("books", True)]
+
+def test_seq_scans_in_canned_plan():
+    plan = {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            {"Node Type": "Index Scan", "Relation Name": "books", "Index Cond": "(id = 1)"},
+            {
+                "Node Type": "Hash",
+                "Plans": [{"Node Type": "Seq Scan", "Relation Name": "reviews", "Filter": "(book_id = 1)"}],
+            },
+            {"Node Type": "Seq Scan", "Relation Name": "users"},
+        ],
+    }
+
+    assert list(_seq_scans(plan)) == [("reviews", "(book_id = 1)")]
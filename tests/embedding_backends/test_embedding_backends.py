@@ -0,0 +1,51 @@
+import numpy as np
+from app.services.embedding_backends import BucketedEncoder, parse_buckets
+from app.services.embedding_parity import check_parity
+from benchmarks.stubs import StubEmbeddingModel
+
+class WordTokenizerModel(StubEmbeddingModel):
+    """Stub model with a whitespace tokenizer, recording the batch sizes it was asked for"""
+    max_seq_length = 16
+
+    def __init__(self):
+        super().__init__(dimension=32)
+        self.batch_sizes = []
+
+    def tokenizer(self, texts, truncation=True, max_length=None):
+        return {"input_ids": [text.split()[:max_length] for text in texts]}
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        self.batch_sizes.append(batch_size)
+        return super().encode(sentences)
+
+class NoisyModel(StubEmbeddingModel):
+    def encode(self, sentences, **kwargs):
+        vectors = super().encode(sentences)
+        return vectors + np.random.default_rng(0).normal(0, 0.5, vectors.shape).astype(np.float32)
+
+texts = ["one two", "one two three four five six seven eight nine ten", "alpha", "beta gamma delta epsilon"]
+
+def test_parse_buckets():
+    assert parse_buckets("128, 32,64") == [32, 64, 128]
+    assert parse_buckets("") == []
+
+def test_bucketed_encoder_preserves_order():
+    model = WordTokenizerModel()
+    encoder = BucketedEncoder(model, [2, 4], batch_tokens=64)
+
+    vectors = encoder.encode(texts)
+
+    np.testing.assert_allclose(vectors, StubEmbeddingModel(dimension=32).encode(texts))
+    # Buckets of 2, 4 and max_seq_length (16) tokens
+    assert sorted(model.batch_sizes) == [4, 16, 32]
+
+def test_parity_of_identical_models():
+    report = check_parity(StubEmbeddingModel(), StubEmbeddingModel(), texts, ["one two"], k=2)
+
+    assert report["min_cosine"] > 0.999
+    assert report["recall_at_2"] == 1.0
+
+def test_parity_detects_drift():
+    report = check_parity(StubEmbeddingModel(), NoisyModel(), texts, ["one two"], k=1)
+
+    assert report["min_cosine"] < 0.98
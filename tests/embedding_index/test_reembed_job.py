@@ -0,0 +1,91 @@
+import numpy as np
+from app.services import embedding_index, reembed_job
+from app.services.recommendation_engine import text_digest
+from benchmarks.stubs import StubEmbeddingModel
+
+def test_encode_page_keeps_id_order():
+    reembed_job._worker_model = StubEmbeddingModel()
+    texts = ["a much longer book description", "short", "medium length text"]
+
+    first_id, ids, vectors, digests = reembed_job.encode_page(7, [7, 8, 9], texts, batch_size=2)
+
+    assert first_id == 7
+    assert ids.tolist() == [7, 8, 9]
+    np.testing.assert_allclose(vectors, StubEmbeddingModel().encode(texts))
+    assert digests.tolist() == [text_digest(text) for text in texts]
+
+def test_incomplete_version_is_resumed(tmp_path):
+    version = embedding_index.new_version(str(tmp_path), "all-MiniLM-L6-v2")
+    version.save_checkpoint({"model": "all-MiniLM-L6-v2", "backend": "local", "last_id": 2, "pages": []})
+
+    resumed = embedding_index.find_incomplete_version(str(tmp_path), "all-MiniLM-L6-v2", "local")
+
+    assert resumed.version == version.version
+    assert resumed.load_checkpoint()["last_id"] == 2
+    assert embedding_index.find_incomplete_version(str(tmp_path), "other-model", "local") is None
+    # Vectors from two backends never share a version
+    assert embedding_index.find_incomplete_version(str(tmp_path), "all-MiniLM-L6-v2", "onnx-int8") is None
+
+def test_finalize_and_activate(tmp_path):
+    version = embedding_index.new_version(str(tmp_path), "model")
+    pages = [
+        version.write_page(1, np.array([1, 2]), np.ones((2, 3), dtype=np.float32), np.array([11, 12])),
+        version.write_page(3, np.array([3]), np.zeros((1, 3), dtype=np.float32), np.array([13])),
+    ]
+    assert embedding_index.load_current(str(tmp_path)) is None
+
+    version.finalize(pages, {"model": "model", "dimension": 3})
+    embedding_index.activate(str(tmp_path), version)
+    ids, vectors, manifest = embedding_index.load_current(str(tmp_path))
+
+    assert ids.tolist() == [1, 2, 3]
+    assert vectors.shape == (3, 3)
+    assert manifest["count"] == 3
+    assert embedding_index.load_digests(str(tmp_path), ids) == {1: 11, 2: 12, 3: 13}
+
+def finished_build(index_dir, name, activate=True, backend="local"):
+    version = embedding_index.IndexVersion(index_dir, name)
+    version.save_checkpoint({"model": "model", "backend": backend, "last_id": 1, "pages": [], "activate": activate})
+    page = version.write_page(1, np.array([1]), np.ones((1, 3), dtype=np.float32))
+    version.finalize([page], {"model": "model", "dimension": 3})
+    return version
+
+def test_finished_but_unactivated_build_is_activated_instead_of_rebuilt(tmp_path, monkeypatch):
+    import asyncio
+    from app.config import settings
+
+    index_dir = str(tmp_path)
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL", "model")
+    embedding_index.activate(index_dir, finished_build(index_dir, "model-1"))
+    finished_build(index_dir, "model-2", activate=False)
+    finished_build(index_dir, "model-3", backend="onnx-int8")
+    pending = finished_build(index_dir, "model-4")
+    # A crash between finalize and activate left model-4 built but inactive
+
+    def no_database(*args, **kwargs):
+        raise AssertionError("the catalog was re-embedded")
+    monkeypatch.setattr(reembed_job, "create_async_engine", no_database)
+    version = asyncio.run(reembed_job.run_job(index_dir, 1, 10, 10, "local", 1))
+
+    assert version.version == pending.version
+    assert embedding_index.current_version(index_dir) == "model-4"
+    # Nothing newer than the active version is waiting any more
+    assert embedding_index.find_unactivated_version(index_dir, "model", "local") is None
+
+def test_finalize_streams_pages_into_a_memory_map(tmp_path):
+    version = embedding_index.new_version(str(tmp_path), "model")
+    rng = np.random.default_rng(0)
+    chunks = [rng.normal(size=(n, 4)).astype(np.float32) for n in (3, 1, 5)]
+    pages, first_id = [], 1
+    for chunk in chunks:
+        pages.append(version.write_page(first_id, np.arange(first_id, first_id + len(chunk)), chunk))
+        first_id += len(chunk)
+
+    version.finalize(pages, {"model": "model", "dimension": 4})
+    embedding_index.activate(str(tmp_path), version)
+    ids, vectors, _ = embedding_index.load_current(str(tmp_path))
+
+    assert ids.tolist() == list(range(1, 10))
+    np.testing.assert_array_equal(vectors, np.concatenate(chunks))
+    # Pages without digests (older builds) leave no digests file behind
+    assert embedding_index.load_digests(str(tmp_path), ids) == {}
@@ -0,0 +1,73 @@
+import socket
+import threading
+import numpy as np
+import pytest
+from app.services.embedding_server import EmbeddingClient, EmbeddingServer
+from benchmarks.stubs import StubEmbeddingModel
+
+model = StubEmbeddingModel(dimension=32)
+
+def serve(socket_path):
+    server = EmbeddingServer(socket_path, model)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / "embeddings.sock")
+
+@pytest.fixture
+def server(socket_path):
+    server = serve(socket_path)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_round_trip_single_text_and_empty_list(server, socket_path):
+    client = EmbeddingClient(socket_path)
+    try:
+        vector = client.encode("a detective story")
+        empty = client.encode([])
+    finally:
+        client.close()
+
+    np.testing.assert_allclose(vector, model.encode(["a detective story"])[0])
+    assert empty.shape == (0, 32)
+
+def test_large_batches_are_sent_in_chunks_through_a_bounded_pool(server, socket_path):
+    client = EmbeddingClient(socket_path, chunk_size=3, max_idle=2)
+    texts = [f"book number {i} about the sea" for i in range(10)]
+    try:
+        threads = [threading.Thread(target=client.encode, args=(texts,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        vectors = client.encode(texts)
+        assert len(client._idle) <= 2
+        assert all(connection.block.size == 3 * 32 * 4 for connection in client._idle)
+    finally:
+        client.close()
+
+    np.testing.assert_allclose(vectors, model.encode(texts))
+
+def test_client_reconnects_after_server_restart(server, socket_path):
+    client = EmbeddingClient(socket_path)
+    try:
+        client.encode(["first"])
+        server.shutdown()
+        server.server_close()
+        # The pooled connection now points at a server that is gone
+        for connection in client._idle:
+            connection.sock.shutdown(socket.SHUT_RDWR)
+        restarted = serve(socket_path)
+        try:
+            vectors = client.encode(["second"])
+            assert len(client._idle) == 1
+        finally:
+            restarted.shutdown()
+            restarted.server_close()
+    finally:
+        client.close()
+
+    np.testing.assert_allclose(vectors, model.encode(["second"]))
@@ -0,0 +1,211 @@
+import asyncio
+import pytest
+from app.events import EventBus, ChangeEvent, BOOK, REVIEW, CREATED, UPDATED, DELETED
+
+@pytest.mark.asyncio
+async def test_subscriber_receives_events_in_batches():
+    bus = EventBus(notify=False)
+    batches = []
+    async def handler(events):
+        batches.append(events)
+    bus.subscribe("test", handler, max_delay_ms=20)
+    await bus.start()
+    try:
+        await bus.publish_many(REVIEW, CREATED, [(1, 10), (2, 10), (3, 11)])
+        await bus.publish(BOOK, DELETED, 10)
+        await asyncio.sleep(0.05)
+    finally:
+        await bus.stop()
+
+    assert len(batches) == 1
+    assert [(e.entity, e.op, e.id, e.book_id) for e in batches[0]] == [
+        (REVIEW, CREATED, 1, 10), (REVIEW, CREATED, 2, 10), (REVIEW, CREATED, 3, 11), (BOOK, DELETED, 10, None),
+    ]
+
+@pytest.mark.asyncio
+async def test_subscriber_only_sees_its_entities():
+    bus = EventBus(notify=False)
+    seen = []
+    async def handler(events):
+        seen.extend(e.entity for e in events)
+    bus.subscribe("books", handler, entities={BOOK}, max_delay_ms=5)
+    await bus.start()
+    try:
+        await bus.publish(REVIEW, CREATED, 1, book_id=1)
+        await bus.publish(BOOK, CREATED, 2)
+        await asyncio.sleep(0.03)
+    finally:
+        await bus.stop()
+
+    assert seen == [BOOK]
+
+@pytest.mark.asyncio
+async def test_gap_in_sequence_triggers_rebuild():
+    bus = EventBus(notify=False)
+    handled, rebuilds = [], []
+    async def handler(events):
+        handled.extend(e.seq for e in events)
+    async def rebuild():
+        rebuilds.append(True)
+    # No reorder window: a gap is declared as soon as it is seen
+    subscriber = bus.subscribe("test", handler, rebuild=rebuild, reorder_ms=0)
+
+    await subscriber.deliver([ChangeEvent(seq=1, entity=BOOK, op=CREATED, id=1)])
+    await subscriber.deliver([ChangeEvent(seq=4, entity=BOOK, op=CREATED, id=4)])
+    await subscriber.deliver([ChangeEvent(seq=5, entity=BOOK, op=CREATED, id=5)])
+    # Already applied: duplicates from a redelivery are dropped
+    await subscriber.deliver([ChangeEvent(seq=5, entity=BOOK, op=CREATED, id=5)])
+
+    assert handled == [1, 5]
+    assert rebuilds == [True]
+
+@pytest.mark.asyncio
+async def test_out_of_order_events_are_reordered_without_rebuild():
+    bus = EventBus(notify=False)
+    handled, rebuilds = [], []
+    async def handler(events):
+        handled.append([e.seq for e in events])
+    async def rebuild():
+        rebuilds.append(True)
+    subscriber = bus.subscribe("test", handler, rebuild=rebuild, reorder_ms=1000)
+
+    await subscriber.deliver([ChangeEvent(seq=10, entity=BOOK, op=CREATED, id=10)])
+    # 12 is dispatched locally before 11 arrives through NOTIFY from another worker
+    await subscriber.deliver([ChangeEvent(seq=12, entity=BOOK, op=CREATED, id=12)])
+    await subscriber.deliver([ChangeEvent(seq=11, entity=BOOK, op=CREATED, id=11)])
+
+    assert handled == [[10], [11, 12]]
+    assert rebuilds == []
+    assert not subscriber.pending
+
+@pytest.mark.asyncio
+async def test_gap_still_open_after_reorder_window_triggers_rebuild():
+    bus = EventBus(notify=False)
+    handled, rebuilds = [], []
+    async def handler(events):
+        handled.extend(e.seq for e in events)
+    async def rebuild():
+        rebuilds.append(True)
+    subscriber = bus.subscribe("test", handler, rebuild=rebuild, max_delay_ms=1, reorder_ms=30)
+    await bus.start()
+    try:
+        subscriber.queue.put_nowait(ChangeEvent(seq=1, entity=BOOK, op=CREATED, id=1))
+        await asyncio.sleep(0.01)
+        subscriber.queue.put_nowait(ChangeEvent(seq=3, entity=BOOK, op=CREATED, id=3))
+        await asyncio.sleep(0.01)
+        assert rebuilds == [] and subscriber.pending
+        # No further events: the window closes on its own
+        await asyncio.sleep(0.06)
+    finally:
+        await bus.stop()
+
+    assert handled == [1]
+    assert rebuilds == [True]
+    assert subscriber.last_seq == 3 and not subscriber.pending
+
+@pytest.mark.asyncio
+async def test_publish_without_started_bus_is_a_no_op():
+    bus = EventBus(notify=False)
+    handled = []
+    async def handler(events):
+        handled.extend(events)
+    subscriber = bus.subscribe("test", handler)
+
+    event = await bus.publish(BOOK, CREATED, 1)
+
+    assert event.seq == 1
+    assert subscriber.queue.empty()
+
+@pytest.mark.asyncio
+async def test_failed_handler_triggers_rebuild_on_next_batch():
+    bus = EventBus(notify=False)
+    handled, rebuilds = [], []
+    async def handler(events):
+        if events[0].id == 1:
+            raise RuntimeError("encode failed")
+        handled.extend(e.id for e in events)
+    async def rebuild():
+        rebuilds.append(True)
+    subscriber = bus.subscribe("test", handler, rebuild=rebuild)
+
+    await subscriber.deliver([ChangeEvent(seq=1, entity=BOOK, op=CREATED, id=1)])
+    assert subscriber.dirty
+    await subscriber.deliver([ChangeEvent(seq=2, entity=BOOK, op=CREATED, id=2)])
+    await subscriber.deliver([ChangeEvent(seq=3, entity=BOOK, op=CREATED, id=3)])
+
+    assert rebuilds == [True]
+    assert handled == [3]
+    assert not subscriber.dirty
+
+@pytest.mark.asyncio
+async def test_failed_rebuild_is_retried_without_new_events():
+    bus = EventBus(notify=False)
+    attempts = []
+    async def handler(events):
+        raise RuntimeError("db down")
+    async def rebuild():
+        attempts.append(True)
+        if len(attempts) == 1:
+            raise RuntimeError("still down")
+    subscriber = bus.subscribe("test", handler, rebuild=rebuild, max_delay_ms=1)
+    subscriber.retry_delay = 0.02
+    await bus.start()
+    try:
+        await bus.publish(BOOK, CREATED, 1)
+        await asyncio.sleep(0.15)
+    finally:
+        await bus.stop()
+
+    assert len(attempts) == 2
+    assert not subscriber.dirty
+
+class FakeConnection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.closed = False
+        self.seq = 0
+        self.notified = []
+    async def fetch(self, query, count):
+        if self.fail:
+            raise ConnectionError("connection dropped")
+        self.seq += count
+        return [{"seq": seq} for seq in range(self.seq - count + 1, self.seq + 1)]
+    async def fetchval(self, query):
+        self.seq += 1
+        return self.seq
+    async def execute(self, query, *args):
+        if self.fail:
+            raise ConnectionError("connection dropped")
+        self.notified.append(args)
+    def terminate(self):
+        self.closed = True
+    async def close(self):
+        self.closed = True
+
+@pytest.mark.asyncio
+async def test_publish_survives_dropped_connection_and_reconnects(monkeypatch):
+    bus = EventBus(notify=True, reconnect_delay=0.01)
+    broken, fresh = FakeConnection(fail=True), FakeConnection()
+    connections = iter([broken, fresh])
+    async def connect():
+        return next(connections)
+    monkeypatch.setattr(bus, "_connect", connect)
+    rebuilds = []
+    async def handler(events):
+        pass
+    async def rebuild():
+        rebuilds.append(True)
+    bus.subscribe("test", handler, rebuild=rebuild, max_delay_ms=1)
+    await bus.start()
+    try:
+        assert await bus.publish(BOOK, CREATED, 1) is None
+        await asyncio.sleep(0.05)
+        event = await bus.publish(BOOK, UPDATED, 1)
+    finally:
+        await bus.stop()
+
+    assert broken.closed
+    assert rebuilds
+    # One sequence number is burned on reconnect so other nodes see the gap
+    assert event.seq == 2
+    assert len(fresh.notified) == 1
@@ -0,0 +1,84 @@
+import threading
+import pytest
+from app import metrics
+from app.config import settings
+from app.services.llama_service import llama_service, parse_options, MAP, REDUCE
+from benchmarks.fake_ollama import start_fake_ollama
+
+@pytest.fixture
+def fake_ollama(monkeypatch):
+    server = start_fake_ollama()
+    monkeypatch.setattr(settings, "OLLAMA_HOST", server.url)
+    llama_service.close()
+    yield server
+    llama_service.close()
+    server.shutdown()
+
+def test_parse_options():
+    assert parse_options("num_predict=128, num_ctx=2048,temperature=0.2") == {
+        "num_predict": 128, "num_ctx": 2048, "temperature": 0.2,
+    }
+    assert parse_options("") == {}
+
+def test_map_and_reduce_use_their_own_model_and_options(fake_ollama, monkeypatch):
+    monkeypatch.setattr(settings, "OLLAMA_MAP_MODEL", "llama3.2:1b-q4")
+    monkeypatch.setattr(settings, "OLLAMA_REDUCE_MODEL", "llama3.1:8b")
+    monkeypatch.setattr(settings, "OLLAMA_MAP_OPTIONS", "num_predict=64,num_ctx=1024")
+    monkeypatch.setattr(settings, "OLLAMA_REDUCE_OPTIONS", "num_predict=512,num_ctx=8192")
+
+    summary, timings = llama_service.summarize_book("x" * (settings.CHUNK_SIZE * 3 + 50))
+
+    map_calls, reduce_call = fake_ollama.calls[:-1], fake_ollama.calls[-1]
+    assert len(map_calls) == 4
+    assert all(call["model"] == "llama3.2:1b-q4" for call in map_calls)
+    assert all(call["options"] == {"num_predict": 64, "num_ctx": 1024} for call in map_calls)
+    assert reduce_call["model"] == "llama3.1:8b"
+    assert reduce_call["options"] == {"num_predict": 512, "num_ctx": 8192}
+    assert summary.startswith("Summary of")
+    assert timings[MAP]["calls"] == 4 and timings[REDUCE]["calls"] == 1
+    assert timings[MAP]["model"] == "llama3.2:1b-q4" and timings[REDUCE]["model"] == "llama3.1:8b"
+    assert timings[MAP]["seconds"] > 0 and timings[REDUCE]["seconds"] > 0
+    assert ("map", "llama3.2:1b-q4") in metrics.llm_stage_duration._series
+    assert metrics.llm_calls._values[("reduce", "llama3.1:8b")] >= 1
+
+def test_stages_fall_back_to_ollama_model(fake_ollama, monkeypatch):
+    monkeypatch.setattr(settings, "OLLAMA_MAP_MODEL", "")
+    monkeypatch.setattr(settings, "OLLAMA_REDUCE_MODEL", "")
+    monkeypatch.setattr(settings, "OLLAMA_MAP_OPTIONS", "")
+
+    llama_service.generate_book_summary("short book")
+
+    assert [call["model"] for call in fake_ollama.calls] == [settings.OLLAMA_MODEL] * 2
+    assert not fake_ollama.calls[0]["options"]
+
+def test_client_is_reused_across_calls(fake_ollama):
+    client = llama_service.client
+    llama_service.summarize_chunk("one")
+    llama_service.summarize_chunk("two", REDUCE)
+    assert llama_service.client is client
+
+def test_pool_wait_is_bounded(monkeypatch):
+    server = start_fake_ollama(latency=0.3)
+    monkeypatch.setattr(settings, "OLLAMA_HOST", server.url)
+    monkeypatch.setattr(settings, "OLLAMA_MAX_CONNECTIONS", 1)
+    monkeypatch.setattr(settings, "OLLAMA_POOL_TIMEOUT", 0.05)
+    llama_service.close()
+    errors = []
+    def summarize():
+        try:
+            llama_service.summarize_chunk("waiting for a connection")
+        except TimeoutError as e:
+            errors.append(e)
+    try:
+        llama_service.client
+        threads = [threading.Thread(target=summarize) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        llama_service.close()
+        server.shutdown()
+
+    assert len(errors) == 1
+    assert len(server.calls) == 1
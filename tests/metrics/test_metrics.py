@@ -0,0 +1,47 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from app import metrics
+from app.metrics import Counter, Histogram, RequestLatencyMiddleware
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "/books/")
+
+    lines = histogram.render().splitlines()
+
+    assert lines[:2] == ["# HELP test_seconds Test latency.", "# TYPE test_seconds histogram"]
+    assert lines[2:] == [
+        'test_seconds_bucket{route="/books/",le="0.1"} 1',
+        'test_seconds_bucket{route="/books/",le="1.0"} 3',
+        'test_seconds_bucket{route="/books/",le="+Inf"} 4',
+        'test_seconds_sum{route="/books/"} 6.05',
+        'test_seconds_count{route="/books/"} 4',
+    ]
+
+def test_label_values_are_escaped():
+    counter = Counter("test_total", "Test counter.", ("route",))
+    counter.inc(2, 'a"b\\c\nd')
+
+    assert counter.render().splitlines()[-1] == 'test_total{route="a\\"b\\\\c\\nd"} 2'
+
+def test_streamed_response_latency_includes_body():
+    app = FastAPI()
+    app.add_middleware(RequestLatencyMiddleware)
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(3):
+                await asyncio.sleep(0.05)
+                yield b"{}\n"
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    with TestClient(app) as client:
+        assert client.get("/stream").status_code == 200
+
+    _, total, count = metrics.http_request_duration._series[("GET", "/stream", "200")]
+    assert count == 1
+    assert total >= 0.15
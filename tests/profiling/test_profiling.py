@@ -0,0 +1,129 @@
+import pstats
+import pytest
+from app import profiling
+from app.services.llama_service import llama_service
+
+def summarize_in_worker_thread(content):
+    return f"summary of {content}"
+
+@pytest.mark.asyncio
+async def test_summary_worker_thread_is_part_of_the_request_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(llama_service, "generate_book_summary", summarize_in_worker_thread)
+    session = profiling.ProfileSession(str(tmp_path))
+    token = profiling._current_session.set(session)
+    try:
+        session.profiler.enable()
+        summary = await llama_service.generate_summary("a book")
+        session.profiler.disable()
+    finally:
+        profiling._current_session.reset(token)
+    session.dump()
+
+    functions = {name for _, _, name in pstats.Stats(session.path).stats}
+    assert summary == "summary of a book"
+    assert "summarize_in_worker_thread" in functions
+
+def test_parse_sample_rates():
+    assert profiling.parse_sample_rates("/recommendations/=1, /books/=50") == {"/recommendations/": 0.01, "/books/": 0.5}
+
+async def call(middleware, headers=(), query_string=b"", path="/books/"):
+    """Run one request through the middleware; returns the response headers"""
+    sent = []
+    async def receive():
+        return {"type": "http.request", "body": b""}
+    async def send(message):
+        sent.append(message)
+    scope = {
+        "type": "http",
+        "path": path,
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+        "query_string": query_string,
+    }
+    await middleware(scope, receive, send)
+    return {name.decode(): value.decode() for name, value in sent[0]["headers"]}
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+def profiler(tmp_path, **options):
+    options = {"enabled": True, "token": "s3cret", "sample_rates": "", "profile_dir": str(tmp_path), **options}
+    return profiling.ProfilingMiddleware(app, **options)
+
+@pytest.mark.asyncio
+async def test_profiling_is_off_by_default(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling.settings, "PROFILING_TOKEN", "s3cret")
+    middleware = profiling.ProfilingMiddleware(app, profile_dir=str(tmp_path))
+
+    headers = await call(middleware, headers=[(profiling.PROFILE_HEADER, "s3cret")])
+
+    assert middleware.enabled is False
+    assert profiling.PROFILE_ID_HEADER.lower() not in headers
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("token,supplied", [
+    ("s3cret", "wrong"),
+    ("s3cret", ""),
+    # No token configured: nothing can be requested, not even with an empty value
+    ("", ""),
+])
+async def test_wrong_or_empty_token_is_rejected(tmp_path, token, supplied):
+    middleware = profiler(tmp_path, token=token)
+
+    by_header = await call(middleware, headers=[(profiling.PROFILE_HEADER, supplied)])
+    by_query = await call(middleware, query_string=f"profile={supplied}".encode())
+
+    assert profiling.PROFILE_ID_HEADER.lower() not in by_header
+    assert profiling.PROFILE_ID_HEADER.lower() not in by_query
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("headers,query_string", [
+    ([(profiling.PROFILE_HEADER, "s3cret")], b""),
+    ([], b"profile=s3cret"),
+    # The header wins over the query flag
+    ([(profiling.PROFILE_HEADER, "s3cret")], b"profile=wrong"),
+])
+async def test_header_or_query_flag_profiles_the_request(tmp_path, headers, query_string):
+    response_headers = await call(profiler(tmp_path), headers=headers, query_string=query_string)
+
+    profile_id = response_headers[profiling.PROFILE_ID_HEADER.lower()]
+    path = tmp_path / f"{profile_id}.pstats"
+    assert path.exists()
+    assert any(name == "app" for _, _, name in pstats.Stats(str(path)).stats)
+
+@pytest.mark.asyncio
+async def test_wrong_header_is_not_rescued_by_the_query_flag(tmp_path):
+    headers = await call(profiler(tmp_path), headers=[(profiling.PROFILE_HEADER, "wrong")], query_string=b"profile=s3cret")
+
+    assert profiling.PROFILE_ID_HEADER.lower() not in headers
+
+@pytest.mark.asyncio
+async def test_sampling_profiles_only_the_listed_paths(tmp_path, monkeypatch):
+    middleware = profiler(tmp_path, token="", sample_rates="/recommendations/=50")
+
+    monkeypatch.setattr(profiling.random, "random", lambda: 0.49)
+    sampled = await call(middleware, path="/recommendations/")
+    unlisted = await call(middleware, path="/books/")
+    monkeypatch.setattr(profiling.random, "random", lambda: 0.5)
+    skipped = await call(middleware, path="/recommendations/")
+
+    assert profiling.PROFILE_ID_HEADER.lower() in sampled
+    assert profiling.PROFILE_ID_HEADER.lower() not in unlisted
+    assert profiling.PROFILE_ID_HEADER.lower() not in skipped
+    assert [path.name for path in tmp_path.iterdir()] == [f"{sampled[profiling.PROFILE_ID_HEADER.lower()]}.pstats"]
+
+@pytest.mark.asyncio
+async def test_profile_is_written_off_the_event_loop(tmp_path, monkeypatch):
+    import threading
+    dumped_on = []
+    dump = profiling.ProfileSession.dump
+    def record(session):
+        dumped_on.append(threading.current_thread())
+        dump(session)
+    monkeypatch.setattr(profiling.ProfileSession, "dump", record)
+
+    await call(profiler(tmp_path), headers=[(profiling.PROFILE_HEADER, "s3cret")])
+
+    assert dumped_on and dumped_on[0] is not threading.current_thread()
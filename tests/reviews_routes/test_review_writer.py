@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from app.services.review_writer import BookNotFound, ReviewBatchWriter
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+    def scalars(self):
+        return self
+    def mappings(self):
+        return self
+    def all(self):
+        return self.rows
+
+class FakeSession:
+    """Records executed statements; books 1 and 2 exist"""
+    def __init__(self, log):
+        self.log = log
+    async def __aenter__(self):
+        return self
+    async def __aexit__(self, *exc):
+        return False
+    async def execute(self, statement, params=None):
+        if params is None:
+            return FakeResult([1, 2])
+        self.log.append(params)
+        return FakeResult([{"id": i + 1, "rating": p["rating"], "review_text": p["review_text"], "book_id": p["book_id"], "user_id": p["user_id"]} for i, p in enumerate(params)])
+    async def commit(self):
+        self.log.append("commit")
+
+@pytest.mark.asyncio
+async def test_concurrent_reviews_share_one_insert():
+    log, batches = [], []
+    writer = ReviewBatchWriter(lambda: FakeSession(log), max_batch=10, max_delay_ms=50)
+    async def listener(rows):
+        batches.append(rows)
+    writer.add_batch_listener(listener)
+    await writer.start()
+
+    results = await asyncio.gather(*[
+        writer.submit(book_id, 7, {"rating": 4.0, "review_text": None}) for book_id in (1, 2, 1)
+    ])
+    await writer.stop()
+
+    assert [row["book_id"] for row in results] == [1, 2, 1]
+    assert len(log) == 2 and len(log[0]) == 3 and log[1] == "commit"
+    assert len(batches) == 1
+
+@pytest.mark.asyncio
+async def test_unknown_book_is_rejected():
+    log = []
+    writer = ReviewBatchWriter(lambda: FakeSession(log), max_batch=10, max_delay_ms=10)
+    await writer.start()
+
+    with pytest.raises(BookNotFound):
+        await writer.submit(99, 7, {"rating": 1.0, "review_text": None})
+    await writer.stop()
+
+    assert log == []
+
+@pytest.mark.asyncio
+async def test_stop_flushes_the_batch_being_collected():
+    log = []
+    writer = ReviewBatchWriter(lambda: FakeSession(log), max_batch=10, max_delay_ms=1000)
+    await writer.start()
+
+    pending = asyncio.ensure_future(writer.submit(1, 7, {"rating": 5.0, "review_text": "Kept"}))
+    await asyncio.sleep(0.05)
+    await asyncio.wait_for(writer.stop(), 0.5)
+
+    row = await asyncio.wait_for(pending, 0.1)
+    assert row["review_text"] == "Kept"
+    assert log[-1] == "commit"
+    with pytest.raises(RuntimeError):
+        await writer.submit(1, 7, {"rating": 5.0, "review_text": None})
@@ -0,0 +1,96 @@
+import orjson
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+from app.api import books, reviews
+from app.auth import get_current_user
+from app.database import get_db
+from app.models import Book, Review
+from app.serialization import JSON_MEDIA_TYPE, NDJSON_MEDIA_TYPE, wants_ndjson
+from tests.sqlite_session import SyncBackedSession, sqlite_engine
+
+BOOKS = [
+    {"id": 1, "title": "Dune", "author": "Frank Herbert", "genre": "Science Fiction", "year_published": 1965, "summary": "Spice"},
+    {"id": 2, "title": "Emma", "author": "Jane Austen", "genre": "Romance", "year_published": 1815, "summary": None},
+]
+REVIEWS = [
+    {"id": 1, "book_id": 1, "user_id": 1, "rating": 5.0, "review_text": "Great"},
+    {"id": 2, "book_id": 1, "user_id": 1, "rating": 3.5, "review_text": None},
+    {"id": 3, "book_id": 2, "user_id": 1, "rating": 4.0, "review_text": "Witty"},
+]
+
+@pytest.fixture
+def client(monkeypatch):
+    engine = sqlite_engine()
+    with Session(engine) as session:
+        session.add_all([Book(**book) for book in BOOKS])
+        session.add_all([Review(**review) for review in REVIEWS])
+        session.commit()
+
+    def session_factory():
+        return SyncBackedSession(Session(engine))
+
+    async def get_test_db():
+        with Session(engine) as session:
+            yield SyncBackedSession(session)
+
+    # NDJSON streams open their own session
+    monkeypatch.setattr(books, "async_session", session_factory)
+    monkeypatch.setattr(reviews, "async_session", session_factory)
+    app = FastAPI()
+    app.include_router(books.router, prefix="/books")
+    app.include_router(reviews.router, prefix="/reviews")
+    app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_current_user] = lambda: 1
+    with TestClient(app) as client:
+        yield client
+    engine.dispose()
+
+def ndjson_rows(response):
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == NDJSON_MEDIA_TYPE
+    assert response.text.endswith("\n")
+    return [orjson.loads(line) for line in response.text.splitlines()]
+
+def test_book_list_is_orjson_encoded(client):
+    response = client.get("/books/")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == JSON_MEDIA_TYPE
+    assert response.content == orjson.dumps(BOOKS)
+
+def test_review_list_is_orjson_encoded(client):
+    response = client.get("/reviews/1")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == JSON_MEDIA_TYPE
+    assert response.json() == REVIEWS[:2]
+
+@pytest.mark.parametrize("params,headers", [
+    ({}, {"Accept": NDJSON_MEDIA_TYPE}),
+    ({"format": "ndjson"}, {}),
+])
+def test_books_stream_one_object_per_line(client, params, headers):
+    assert ndjson_rows(client.get("/books/", params=params, headers=headers)) == BOOKS
+
+@pytest.mark.parametrize("params,headers", [
+    ({}, {"Accept": NDJSON_MEDIA_TYPE}),
+    ({"format": "ndjson"}, {}),
+])
+def test_reviews_stream_one_object_per_line(client, params, headers):
+    assert ndjson_rows(client.get("/reviews/1", params=params, headers=headers)) == REVIEWS[:2]
+
+def test_reviews_of_missing_book_are_not_found(client):
+    assert client.get("/reviews/99", params={"format": "ndjson"}).status_code == 404
+
+def test_wants_ndjson():
+    def request(query_string=b"", accept=None):
+        headers = [] if accept is None else [(b"accept", accept.encode())]
+        return Request({"type": "http", "query_string": query_string, "headers": headers})
+
+    assert wants_ndjson(request(b"format=ndjson"))
+    assert wants_ndjson(request(accept=f"{NDJSON_MEDIA_TYPE}, application/json;q=0.5"))
+    assert not wants_ndjson(request(accept=JSON_MEDIA_TYPE))
+    assert not wants_ndjson(request(b"format=json"))
@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+from app.services.sharded_search import ShardedSearch, exact_search
+
+rng = np.random.default_rng(0)
+vectors = rng.normal(size=(503, 24)).astype(np.float32)
+queries = rng.normal(size=(6, 24)).astype(np.float32)
+
+def test_in_process_shards_match_brute_force():
+    with ShardedSearch(vectors, workers=1) as search:
+        assert search.search(queries, 10) == exact_search(vectors, queries, 10)
+
+def test_worker_shards_match_brute_force():
+    with ShardedSearch(vectors, workers=3) as search:
+        assert len(search._shards()) == 3
+        assert search.search(queries, 10) == exact_search(vectors, queries, 10)
+
+def test_ties_are_broken_by_row_order_across_shards():
+    duplicated = np.tile(vectors[:5], (20, 1))
+    with ShardedSearch(duplicated, workers=4) as search:
+        hits = search.search(duplicated[2], 7)[0]
+    assert [row for row, _ in hits] == [2, 7, 12, 17, 22, 27, 32]
+    assert hits == exact_search(duplicated, duplicated[2], 7)[0]
+
+def test_results_map_to_ids_and_cap_k():
+    ids = np.arange(1000, 1000 + len(vectors))
+    with ShardedSearch(vectors, ids, workers=2) as search:
+        hits = search.search(queries[0], len(vectors) + 5)[0]
+    assert len(hits) == len(vectors)
+    assert sorted(book_id for book_id, _ in hits) == ids.tolist()
+    scores = [score for _, score in hits]
+    assert scores == sorted(scores, reverse=True)
+
+@pytest.mark.asyncio
+async def test_search_catalog_matches_per_request_scoring(monkeypatch):
+    from app.services import recommendation_engine, sharded_search
+    from benchmarks.stubs import StubEmbeddingModel, make_books
+
+    recommendation_engine.set_embedding_model(StubEmbeddingModel())
+    books = make_books(200)
+    for book_id, book in enumerate(books, start=1):
+        book.id = book_id
+    titles = {book.id: book.title for book in books}
+    looked_up = []
+
+    async def fetch_titles(book_ids):
+        looked_up.append(list(book_ids))
+        return {book_id: titles[book_id] for book_id in book_ids if book_id in titles}
+
+    monkeypatch.setattr(recommendation_engine, "fetch_titles", fetch_titles)
+    try:
+        query = recommendation_engine.book_text(books[42])
+        catalog = recommendation_engine.get_embedding_model().encode(
+            [recommendation_engine.book_text(book) for book in books]
+        )
+        sharded_search._replace_catalog(ShardedSearch(catalog, [book.id for book in books], workers=2), None)
+        found = await recommendation_engine.search_catalog(query, threshold=0.5)
+        # Only the hits are looked up, never the whole catalog
+        assert all(len(ids) <= 2 for ids in looked_up)
+
+        # Best match deleted from the database but still in the index: the next live matches are returned instead
+        del titles[books[42].id]
+        expected = await recommendation_engine.search_catalog(query, top_n=2, threshold=-1)
+        with sharded_search.catalog_search() as search:
+            live_hits = [i for i, _ in search.search(catalog[42], 3)[0] if i != books[42].id]
+    finally:
+        sharded_search.close_catalog_search()
+        recommendation_engine.set_embedding_model(None)
+
+    assert found[0] == books[42].title
+    assert expected == [titles[i] for i in live_hits[:2]]
+
+def test_updates_in_place_match_brute_force_over_live_rows():
+    ids = np.arange(100, 100 + len(vectors))
+    extra = rng.normal(size=(3, 24)).astype(np.float32)
+    with ShardedSearch(vectors, ids, workers=3, capacity=len(vectors) + 3) as search:
+        search.remove(int(ids[10]))
+        search.remove(int(ids[400]))
+        search.upsert(int(ids[20]), extra[0])
+        for book_id, vector in zip((9000, 9001), extra[1:]):
+            search.upsert(book_id, vector)
+        assert search.full is False
+        search.upsert(9002, extra[0])
+        assert search.full
+        with pytest.raises(IndexError):
+            search.upsert(9003, extra[0])
+        got = search.search(queries, 10)
+
+    live_ids = [i for i in ids.tolist() if i not in (ids[10], ids[400])] + [9000, 9001, 9002]
+    live_vectors = np.concatenate([vectors[[i for i in range(len(ids)) if i not in (10, 400)]], extra[1:], extra[:1]])
+    live_vectors[live_ids.index(int(ids[20]))] = extra[0]
+    # Random vectors have no ties, so rankings are comparable although the row order differs
+    expected = [[(live_ids[row], score) for row, score in hits] for hits in exact_search(live_vectors, queries, 10)]
+    for got_hits, expected_hits in zip(got, expected):
+        assert [i for i, _ in got_hits] == [i for i, _ in expected_hits]
+        np.testing.assert_allclose([s for _, s in got_hits], [s for _, s in expected_hits], rtol=1e-6)
+
+def test_catalog_search_only_reloads_on_a_new_index_version(tmp_path, monkeypatch):
+    from app.config import settings
+    from app.services import embedding_index, sharded_search
+
+    monkeypatch.setattr(settings, "EMBEDDING_INDEX_DIR", str(tmp_path))
+    (tmp_path / "versions" / "v1").mkdir(parents=True)
+    (tmp_path / "current").symlink_to("versions/v1")
+    sharded_search._replace_catalog(ShardedSearch(vectors, workers=1), "v1")
+    try:
+        def fail(index_dir, mmap_mode="r"):
+            raise AssertionError("index reloaded for an unchanged version")
+        monkeypatch.setattr(embedding_index, "load_current", fail)
+        with sharded_search.catalog_search() as first, sharded_search.catalog_search() as again:
+            assert again is first
+
+        monkeypatch.setattr(embedding_index, "load_current", lambda index_dir: (np.arange(3), vectors[:3], {}))
+        (tmp_path / "current").unlink()
+        (tmp_path / "current").symlink_to("versions/v2")
+        with sharded_search.catalog_search() as reloaded:
+            assert reloaded is not first and len(reloaded) == 3
+        with sharded_search.catalog_search() as again:
+            assert again is reloaded
+    finally:
+        sharded_search.close_catalog_search()
+
+def test_replaced_catalog_closes_after_its_last_search():
+    from app.services import sharded_search
+
+    sharded_search._replace_catalog(ShardedSearch(vectors, workers=1), "v1")
+    try:
+        with sharded_search.catalog_search() as held:
+            sharded_search._replace_catalog(ShardedSearch(vectors[:3], workers=1), "v2")
+            # Still open for the search that picked it up before the swap
+            assert held.search(queries[0], 3) == exact_search(vectors, queries[0], 3)
+        assert held._block is None
+        with sharded_search.catalog_search() as current:
+            assert len(current) == 3
+    finally:
+        sharded_search.close_catalog_search()
+
+@pytest.mark.asyncio
+async def test_deletes_are_applied_off_the_event_loop(monkeypatch):
+    import threading
+    from app.events import ChangeEvent, DELETED
+    from app.services import sharded_search
+
+    search = ShardedSearch(vectors, np.arange(len(vectors)), workers=1)
+    removed_on = []
+    remove = search.remove
+    monkeypatch.setattr(search, "remove", lambda book_id: (removed_on.append(threading.current_thread()), remove(book_id)))
+    sharded_search._replace_catalog(search, None)
+    try:
+        await sharded_search.apply_book_events([ChangeEvent(1, "book", DELETED, 7)])
+        assert 7 not in search
+        assert removed_on and threading.main_thread() not in removed_on
+    finally:
+        sharded_search.close_catalog_search()
@@ -0,0 +1,138 @@
+import pytest
+import numpy as np
+from app.services.similar_books import SimilarBooksIndex
+
+rng = np.random.default_rng(0)
+ids = np.arange(100, 160)
+vectors = rng.normal(size=(len(ids), 16)).astype(np.float32)
+
+def rebuilt(book_ids, book_vectors, k=5):
+    index = SimilarBooksIndex(k=k, block_size=7)
+    index.build(book_ids, book_vectors)
+    return index
+
+def assert_same_graph(index, expected):
+    for book_id in expected._row_of:
+        got = index.similar(book_id)
+        want = expected.similar(book_id)
+        assert [i for i, _ in got] == [i for i, _ in want]
+        np.testing.assert_allclose([s for _, s in got], [s for _, s in want], rtol=1e-5)
+
+def test_build_matches_brute_force():
+    index = rebuilt(ids, vectors)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ normalized.T
+    np.fill_diagonal(scores, -np.inf)
+
+    for row, book_id in enumerate(ids):
+        expected = ids[np.argsort(-scores[row])[:5]]
+        assert [i for i, _ in index.similar(int(book_id))] == expected.tolist()
+
+def test_incremental_add_and_edit_match_rebuild():
+    index = rebuilt(ids[:40], vectors[:40])
+    for book_id, vector in zip(ids[40:], vectors[40:]):
+        index.upsert(int(book_id), vector)
+    assert_same_graph(index, rebuilt(ids, vectors))
+
+    edited = vectors.copy()
+    edited[3] = rng.normal(size=16)
+    index.upsert(int(ids[3]), edited[3])
+    assert_same_graph(index, rebuilt(ids, edited))
+
+def test_remove_matches_rebuild():
+    index = rebuilt(ids, vectors)
+    index.remove(int(ids[10]))
+
+    assert int(ids[10]) not in index
+    assert_same_graph(index, rebuilt(np.delete(ids, 10), np.delete(vectors, 10, axis=0)))
+
+def test_small_catalog_has_fewer_neighbours():
+    index = rebuilt(ids[:3], vectors[:3])
+
+    assert len(index.similar(int(ids[0]))) == 2
+    assert index.similar(999) is None
+
+def test_column_tiles_match_a_single_tile():
+    tiled = rebuilt(ids, vectors)
+    single = SimilarBooksIndex(k=5, block_size=len(ids))
+    single.build(ids, vectors)
+
+    assert_same_graph(tiled, single)
+
+def test_upsert_into_empty_index():
+    for index in (SimilarBooksIndex(k=3), rebuilt(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32), k=3)):
+        index.upsert(5, np.ones(8))
+        index.upsert(6, np.ones(8))
+
+        assert len(index) == 2
+        assert [i for i, _ in index.similar(5)] == [6]
+        assert [i for i, _ in index.similar(6)] == [5]
+
+def test_remove_last_book_then_upsert():
+    index = rebuilt(ids[:2], vectors[:2], k=3)
+    index.remove(int(ids[0]))
+    index.remove(int(ids[1]))
+    index.upsert(7, vectors[2])
+
+    assert index.similar(7) == []
+
+@pytest.mark.asyncio
+async def test_startup_reconciles_the_loaded_graph_with_the_database(tmp_path, monkeypatch):
+    from app.config import settings
+    from app.services import embedding_index, recommendation_engine, similar_books
+    from app.services.recommendation_engine import text_digest
+
+    class RandomModel:
+        """Unrelated random vector per text, so neighbour rankings have no ties"""
+
+        def encode(self, sentences, **kwargs):
+            return np.stack([np.random.default_rng(text_digest(t) % 2**32).normal(size=16) for t in sentences]).astype(np.float32)
+
+    model = RandomModel()
+
+    def text(seed):
+        return f"book text {seed}"
+
+    texts = {book_id: text(book_id) for book_id in range(1, 41)}
+
+    def build_version(name, catalog):
+        version = embedding_index.IndexVersion(str(tmp_path), name)
+        book_ids = np.array(sorted(catalog))
+        page = version.write_page(
+            1, book_ids, model.encode([catalog[i] for i in book_ids]), np.array([text_digest(catalog[i]) for i in book_ids])
+        )
+        version.finalize([page], {"model": "stub", "dimension": 16})
+        embedding_index.activate(str(tmp_path), version)
+
+    async def fetch_book_texts(book_ids=None):
+        chosen = sorted(texts if book_ids is None else set(book_ids) & set(texts))
+        return chosen, [texts[i] for i in chosen]
+
+    build_version("v1", texts)
+    # Since the index was built: one book added, one edited, one deleted
+    texts[41] = text(41)
+    texts[5] = text(500)
+    del texts[9]
+
+    monkeypatch.setattr(settings, "EMBEDDING_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(recommendation_engine, "fetch_book_texts", fetch_book_texts)
+    monkeypatch.setattr(similar_books, "fetch_book_texts", fetch_book_texts)
+    monkeypatch.setattr(similar_books, "similar_books_index", SimilarBooksIndex(k=4))
+    monkeypatch.setattr(similar_books, "_digests", {})
+    monkeypatch.setattr(similar_books, "_graph_version", None)
+    recommendation_engine.set_embedding_model(model)
+    try:
+        await similar_books.start_similar_books()
+        expected = rebuilt(sorted(texts), model.encode([texts[i] for i in sorted(texts)]), k=4)
+        assert 9 not in similar_books.similar_books_index
+        assert_same_graph(similar_books.similar_books_index, expected)
+
+        # A newly activated version is picked up by the next request
+        texts[42] = text(42)
+        build_version("v2", texts)
+        similar_books.follow_current_version()
+        await similar_books._reload
+        assert similar_books._graph_version == "v2"
+        assert 42 in similar_books.similar_books_index
+    finally:
+        recommendation_engine.set_embedding_model(None)
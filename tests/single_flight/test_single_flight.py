@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+from app.services.single_flight import SingleFlight, request_key
+
+def test_request_key_is_canonical():
+    assert request_key("summary", {"a": 1, "b": 2}) == request_key("summary", {"b": 2, "a": 1})
+    assert request_key("summary", {"a": 1}) != request_key("recommendation", {"a": 1})
+
+@pytest.mark.asyncio
+async def test_duplicate_callers_share_one_computation():
+    flight = SingleFlight()
+    calls = 0
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "summary"
+
+    results = await asyncio.gather(*[flight.do("key", compute) for _ in range(5)])
+
+    assert results == ["summary"] * 5
+    assert calls == 1
+    assert not flight.in_flight("key")
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    flight = SingleFlight()
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError("model error")
+
+    results = await asyncio.gather(*[flight.do("key", compute) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+@pytest.mark.asyncio
+async def test_leader_cancellation_does_not_cancel_followers():
+    flight = SingleFlight()
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    leader = asyncio.create_task(flight.do("key", compute))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("key", compute))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == "done"
+    assert leader.cancelled()
+
+@pytest.mark.asyncio
+async def test_computation_cancelled_when_all_callers_leave():
+    flight = SingleFlight()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+    async def compute():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    caller = asyncio.create_task(flight.do("key", compute))
+    await started.wait()
+    caller.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+
+    assert not flight.in_flight("key")
+
+@pytest.mark.asyncio
+async def test_duplicate_recommendation_requests_read_the_catalog_once(monkeypatch):
+    from app.api import recommendations
+    from app.schemas import RecommendationRequest
+
+    reads = []
+    release = asyncio.Event()
+
+    class Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+    async def get_all_books(session):
+        reads.append(session)
+        await release.wait()
+        return ["book"]
+
+    monkeypatch.setattr(recommendations, "async_session", Session)
+    monkeypatch.setattr(recommendations, "get_all_books", get_all_books)
+    monkeypatch.setattr(recommendations, "recommend_books", lambda content, books: [f"{content} {len(books)}"])
+    request = RecommendationRequest(content="space opera")
+    calls = [asyncio.create_task(recommendations.generate_recommendations(request, "user")) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    responses = await asyncio.gather(*calls)
+
+    assert len(reads) == 1
+    assert responses == [{"recommendation": ["space opera 1"]}] * 3
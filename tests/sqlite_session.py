@@ -0,0 +1,56 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from app.models import Base, User
+
+class SyncBackedSession:
+    """The AsyncSession calls the routes use, run on a sync SQLite session"""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.session.close()
+
+    async def execute(self, statement):
+        return self.session.execute(statement)
+
+    async def stream(self, statement):
+        return StreamedResult(self.session.execute(statement))
+
+    def add(self, instance):
+        self.session.add(instance)
+
+    async def delete(self, instance):
+        self.session.delete(instance)
+
+    async def commit(self):
+        self.session.commit()
+
+    async def refresh(self, instance):
+        self.session.refresh(instance)
+
+class StreamedResult:
+    """AsyncResult.mappings().partitions() over a sync result"""
+
+    def __init__(self, result):
+        self.result = result
+
+    def mappings(self):
+        return StreamedResult(self.result.mappings())
+
+    async def partitions(self):
+        for partition in self.result.partitions():
+            yield partition
+
+def sqlite_engine(wrap=lambda engine: engine):
+    """In-memory SQLite shared across threads, with the tables and one user"""
+    engine = wrap(create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}))
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(id=1, username="reader", email="reader@example.com", hashed_password="x"))
+        session.commit()
+    return engine